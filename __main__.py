@@ -0,0 +1,11 @@
+""" Run the command line interface with the directory itself:
+
+    python path/to/ab-testing size --baseline 0.20625 --delta 0.01
+
+Python puts the directory first on the import path, so the analysis
+modules are found from any working directory, ahead of any installed
+package with the same name.
+"""
+from cli import main
+
+main()
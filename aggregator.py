@@ -0,0 +1,93 @@
+import numpy as np
+
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+
+COLUMNS = ["Pageviews", "Clicks", "Enrollments", "Payments"]
+
+
+class DailyAggregator:
+    """ Running totals over the daily rows of one experiment group.
+
+    The daily counts are kept together with their prefix sums, so the totals
+    for the first N days are a single subtraction, no matter how many days
+    are stored. New days are folded in with append, without going back to
+    the file. Missing values (e.g. enrollments after Nov 2) count as zero in
+    the totals, like DataFrame.sum does.
+    """
+
+    def __init__(self, dates=(), values=None, columns=COLUMNS):
+        self.columns = list(columns)
+        values = np.asarray(
+            [] if values is None else values, dtype=float
+        ).reshape(-1, len(self.columns))
+
+        # Buffers grow by doubling, so appending a day is amortized O(1)
+        capacity = max(len(values), 16)
+        self._dates = list(dates)
+        self._values = np.empty((capacity, len(self.columns)))
+        self._prefix = np.zeros((capacity + 1, len(self.columns)))
+        self._size = len(values)
+
+        self._values[: self._size] = values
+        self._prefix[1 : self._size + 1] = np.nancumsum(values, axis=0)
+
+    @classmethod
+    def from_frame(cls, data, columns=COLUMNS):
+        return cls(data["Date"].tolist(), data[list(columns)].values, columns)
+
+    @classmethod
+    def from_csv(cls, path, columns=COLUMNS):
+        return cls.from_frame(pd.read_csv(path), columns)
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        capacity = 2 * len(self._values)
+        values = np.empty((capacity, len(self.columns)))
+        values[: self._size] = self._values[: self._size]
+        prefix = np.zeros((capacity + 1, len(self.columns)))
+        prefix[: self._size + 1] = self._prefix[: self._size + 1]
+        self._values, self._prefix = values, prefix
+
+    def append(self, date, row):
+        """ Fold in one more day; row holds a value per column, in order. """
+        if self._size == len(self._values):
+            self._grow()
+        row = np.asarray(row, dtype=float)
+        self._values[self._size] = row
+        self._prefix[self._size + 1] = self._prefix[
+            self._size
+        ] + np.nan_to_num(row)
+        self._dates.append(date)
+        self._size += 1
+
+    def totals(self, number_of_days=None, start=0):
+        """ Column totals over days [start, number_of_days), as a Series. """
+        if number_of_days is None:
+            number_of_days = self._size
+        number_of_days = min(max(number_of_days, 0), self._size)
+        start = min(max(start, 0), number_of_days)
+        return pd.Series(
+            self._prefix[number_of_days] - self._prefix[start],
+            index=self.columns,
+        )
+
+    def cumulative(self, number_of_days=None):
+        """ Running totals after each of the first number_of_days days. """
+        return self._prefix[1 : self._size + 1][:number_of_days]
+
+    def values(self, number_of_days=None):
+        """ Daily counts of the first number_of_days days, as a view. """
+        return self._values[: self._size][:number_of_days]
+
+    def frame(self, number_of_days=None):
+        """ The first number_of_days days, shaped like the CSV. """
+        data = pd.DataFrame(self.values(number_of_days), columns=self.columns)
+        # Keep the integer columns integer, only gaps need floats
+        complete = data.columns[data.notna().all()]
+        data[complete] = data[complete].astype(np.int64)
+        data.insert(0, "Date", self._dates[: len(data)])
+        return data
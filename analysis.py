@@ -0,0 +1,644 @@
+""" The sizing and analysis calculations behind app.py, cached by input.
+
+Data is cached by file path and modification time, and the calculations by
+their parameters, in bounded LRU caches. Changing the number of days only
+recomputes the tables that depend on it. The returned DataFrames are shared
+between callers and must be treated as read-only.
+"""
+import math
+import os
+from functools import lru_cache, wraps
+
+import numpy as np
+
+import instrument
+import metrics
+import store
+from aggregator import DailyAggregator
+from arms import multi_arm_analysis
+from correction import correct_table
+from critical import critical_value
+from datacache import load_frame
+from lazyimport import lazy_import
+from resampling import metric_intervals
+from sample_size import sample_size
+from segments import segmented_analysis
+from signtest import sign_test
+from srm import srm_test
+from timeline import significance_timeline
+
+pd = lazy_import("pandas")
+
+CACHE_SIZE = 256
+
+BASELINE_PATH = "baseline.csv"
+CONTROL_PATH = "control.csv"
+EXPERIMENT_PATH = "experiment.csv"
+
+
+@instrument.register_collector
+def cache_counters():
+    """ Hits and misses of the calculation caches, as instrument counters.
+    """
+    counters = {"cache_hits": 0, "cache_misses": 0}
+    for value in list(globals().values()):
+        if hasattr(value, "cache_info") and value.__module__ == __name__:
+            info = value.cache_info()
+            counters["cache_hits"] += info.hits
+            counters["cache_misses"] += info.misses
+    return counters
+
+
+def _stamp(path):
+    """ Cache key for a file, which changes whenever it is rewritten. """
+    return path, os.stat(path).st_mtime_ns
+
+
+def _persistent(name, stamps):
+    """ Keep the results of a calculation in the persistent store too.
+
+    The first stamps positional arguments are file stamps, whose contents
+    go into the key, and the others the parameters.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args):
+            results = store.default_store()
+            if results is None:
+                return function(*args)
+            return results.fetch(
+                name,
+                [stamp[0] for stamp in args[:stamps]],
+                args[stamps:],
+                lambda: function(*args),
+            )
+
+        return wrapper
+
+    return decorator
+
+
+# Loading
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _load_baseline(stamp):
+    return pd.read_csv(stamp[0], names=["Metric", "Value"])
+
+
+@instrument.timed("load_baseline")
+def load_baseline(path=BASELINE_PATH):
+    return _load_baseline(_stamp(path))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _load_group(stamp):
+    return DailyAggregator.from_frame(load_frame(stamp[0]))
+
+
+@instrument.timed("load_group")
+def load_group(path):
+    return _load_group(_stamp(path))
+
+
+# Sizing
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+@_persistent("sizing", 1)
+def _sizing(stamp, alpha, beta, d_min_gross_diff, d_min_net_diff, arms):
+    baseline_values = _load_baseline(stamp)
+
+    gross_sample_size = (
+        sample_size(
+            alpha,
+            1 - beta,
+            baseline_values.loc[4, "Value"],
+            d_min_gross_diff,
+            arms,
+        )
+        * arms
+        / baseline_values.loc[3, "Value"]
+    )
+
+    net_sample_size = (
+        sample_size(
+            alpha,
+            1 - beta,
+            baseline_values.loc[6, "Value"],
+            d_min_net_diff,
+            arms,
+        )
+        * arms
+        / baseline_values.loc[3, "Value"]
+    )
+
+    # Index: metric columns: d_min, sample size
+    sample_sizes = pd.DataFrame(
+        [
+            [
+                baseline_values.loc[4, "Value"],
+                d_min_gross_diff,
+                gross_sample_size,
+            ],
+            [baseline_values.loc[6, "Value"], d_min_net_diff, net_sample_size],
+        ],
+        columns=[
+            "Baseline value",
+            "Minimum detectable difference",
+            "Sample size",
+        ],
+        index=["Gross conversion", "Net conversion"],
+    )
+
+    total_sample_size = math.ceil(max(gross_sample_size, net_sample_size))
+    experiment_duration = math.ceil(
+        total_sample_size / baseline_values.loc[0, "Value"]
+    )
+    return sample_sizes, total_sample_size, experiment_duration
+
+
+@instrument.timed("sizing")
+def sizing(
+    alpha, beta, d_min_gross_diff, d_min_net_diff, path=BASELINE_PATH, arms=2,
+):
+    """ Sample sizes per metric, the total sample size in pageviews and the
+    experiment duration in days at 100% of traffic, split over the arms.
+    """
+    return _sizing(
+        _stamp(path), alpha, beta, d_min_gross_diff, d_min_net_diff, arms
+    )
+
+
+# Analysis
+
+
+def aggregated_table(control_totals, experiment_totals):
+    """ The aggregated data table of app.py, from two total Series. """
+    aggregated_data = pd.DataFrame(
+        [
+            control_totals,
+            experiment_totals,
+            control_totals + experiment_totals,
+        ],
+        index=["Control", "Experiment", "Total"],
+    )
+    aggregated_data.columns = ["Cookies", "Clicks", "Enrollments", "Payments"]
+    return aggregated_data.astype("int64")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _aggregated_data(control_stamp, experiment_stamp, number_of_days):
+    return aggregated_table(
+        _load_group(control_stamp).totals(number_of_days),
+        _load_group(experiment_stamp).totals(number_of_days),
+    )
+
+
+@instrument.timed("aggregated_data")
+def aggregated_data(
+    number_of_days, control_path=CONTROL_PATH, experiment_path=EXPERIMENT_PATH
+):
+    return _aggregated_data(
+        _stamp(control_path), _stamp(experiment_path), number_of_days
+    )
+
+
+def sanity_table(aggregated, alpha):
+    """ The sanity check table of app.py, from an aggregated data table. """
+    critical_two_tailed = critical_value(alpha)
+
+    rows = []
+    for invariant in ["Cookies", "Clicks"]:
+        control = aggregated.loc["Control", invariant]
+        total = aggregated.loc["Total", invariant]
+
+        # Proportion of the invariant that ends up in control
+        control_proportion = control / total
+        margin = critical_two_tailed * math.sqrt(0.5 ** 2 / total)
+        ci_low = 0.5 - margin
+        ci_high = 0.5 + margin
+
+        if control_proportion > ci_low and control_proportion < ci_high:
+            sanity_pass = "yes"
+        else:
+            sanity_pass = "no"
+
+        rows.append([ci_low, ci_high, control_proportion, sanity_pass])
+
+    return pd.DataFrame(
+        rows,
+        columns=["Lower bound", "Upper bound", "Observed", "Passes"],
+        index=["Cookies", "Clicks"],
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+@_persistent("sanity_checks", 2)
+def _sanity_checks(control_stamp, experiment_stamp, number_of_days, alpha):
+    return sanity_table(
+        _aggregated_data(control_stamp, experiment_stamp, number_of_days),
+        alpha,
+    )
+
+
+@instrument.timed("sanity_checks")
+def sanity_checks(
+    number_of_days,
+    alpha,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+):
+    """ 50/50 split checks on the cookies and clicks invariants. """
+    return _sanity_checks(
+        _stamp(control_path), _stamp(experiment_path), number_of_days, alpha
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _srm_checks(
+    control_stamp, experiment_stamp, number_of_days, alpha, expected
+):
+    aggregated = _aggregated_data(
+        control_stamp, experiment_stamp, number_of_days
+    )
+    invariants = ["Cookies", "Clicks"]
+    counts = aggregated.loc[["Control", "Experiment"], invariants].values.T
+    result = srm_test(counts, expected)
+    return pd.DataFrame(
+        {
+            "Expected control share": result["Expected share"][:, 0],
+            "Observed control share": result["Observed share"][:, 0],
+            "Chi-square": result["Chi-square"],
+            "Chi-square p-value": result["Chi-square p-value"],
+            "Binomial p-value": result["Binomial p-value"],
+            "Passes": np.where(
+                (result["Chi-square p-value"] >= alpha)
+                & (result["Binomial p-value"] >= alpha),
+                "yes",
+                "no",
+            ),
+        },
+        index=invariants,
+    )
+
+
+@instrument.timed("srm_checks")
+def srm_checks(
+    number_of_days,
+    alpha,
+    expected=(0.5, 0.5),
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+):
+    """ Sample ratio mismatch tests of the invariants, for any split. """
+    return _srm_checks(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        number_of_days,
+        alpha,
+        tuple(expected),
+    )
+
+
+def conversion_metrics(d_min_gross_diff=None, d_min_net_diff=None):
+    """ The registered metrics, with the gross and net conversion d_min. """
+    d_min = {}
+    if d_min_gross_diff is not None:
+        d_min[metrics.GROSS_CONVERSION.name] = d_min_gross_diff
+    if d_min_net_diff is not None:
+        d_min[metrics.NET_CONVERSION.name] = d_min_net_diff
+    return metrics.registered(d_min)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _conversions(control_stamp, experiment_stamp, number_of_days, evaluated):
+    control = _load_group(control_stamp)
+    experiment = _load_group(experiment_stamp)
+    return pd.DataFrame(
+        [
+            metrics.ratios(
+                control.totals(number_of_days), control.columns, evaluated
+            ),
+            metrics.ratios(
+                experiment.totals(number_of_days),
+                experiment.columns,
+                evaluated,
+            ),
+        ],
+        columns=[metric.name for metric in evaluated],
+        index=["Control", "Experiment"],
+    )
+
+
+@instrument.timed("conversions")
+def conversions(
+    number_of_days, control_path=CONTROL_PATH, experiment_path=EXPERIMENT_PATH
+):
+    """ Value of every registered metric in both groups. """
+    return _conversions(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        number_of_days,
+        conversion_metrics(),
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+@_persistent("confidence_intervals", 2)
+def _confidence_intervals(
+    control_stamp,
+    experiment_stamp,
+    number_of_days,
+    alpha,
+    evaluated,
+    correction,
+):
+    return metrics.confidence_intervals(
+        _load_group(control_stamp).totals(number_of_days),
+        _load_group(experiment_stamp).totals(number_of_days),
+        alpha,
+        evaluated,
+        correction,
+    )
+
+
+@instrument.timed("confidence_intervals")
+def confidence_intervals(
+    number_of_days,
+    alpha,
+    d_min_gross_diff,
+    d_min_net_diff,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+    correction=None,
+):
+    """ Pooled-SE confidence intervals of the differences in every
+    registered metric, with statistical (S.) and practical (P.)
+    significance. correction adds p-values adjusted over the metrics.
+    """
+    return _confidence_intervals(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        number_of_days,
+        alpha,
+        conversion_metrics(d_min_gross_diff, d_min_net_diff),
+        correction,
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _daily_differences(
+    control_stamp, experiment_stamp, number_of_days, evaluated
+):
+    control = _load_group(control_stamp)
+    differences = metrics.daily_differences(
+        control.values(number_of_days),
+        _load_group(experiment_stamp).values(number_of_days),
+        control.columns,
+        evaluated,
+    )
+    table = pd.DataFrame(
+        differences.T, columns=["Δ " + metric.name for metric in evaluated]
+    )
+    table.insert(0, "Date", control.frame(number_of_days)["Date"])
+    return table
+
+
+@instrument.timed("daily_differences")
+def daily_differences(
+    number_of_days, control_path=CONTROL_PATH, experiment_path=EXPERIMENT_PATH
+):
+    return _daily_differences(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        number_of_days,
+        conversion_metrics(),
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+@_persistent("sign_tests", 2)
+def _sign_tests(
+    control_stamp,
+    experiment_stamp,
+    number_of_days,
+    alpha,
+    evaluated,
+    correction,
+):
+    differences = _daily_differences(
+        control_stamp, experiment_stamp, number_of_days, evaluated
+    )
+
+    # One row per metric, one column per day
+    p_values = sign_test(
+        differences.drop(columns="Date").T,
+        alpha,
+        index=[metric.name for metric in evaluated],
+    )[["P-value", "Significant"]]
+    if correction is not None:
+        p_values = correct_table(p_values, alpha, correction)
+    return p_values
+
+
+@instrument.timed("sign_tests")
+def sign_tests(
+    number_of_days,
+    alpha,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+    correction=None,
+):
+    """ Sign tests on the daily conversion differences, leaving out days
+    with missing data. correction adds p-values adjusted over the metrics.
+    """
+    return _sign_tests(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        number_of_days,
+        alpha,
+        conversion_metrics(),
+        correction,
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _bootstrap_intervals(
+    control_stamp, experiment_stamp, number_of_days, alpha, resamples, seed
+):
+    control = _load_group(control_stamp)
+    return metric_intervals(
+        control.values(number_of_days),
+        _load_group(experiment_stamp).values(number_of_days),
+        control.columns,
+        alpha,
+        resamples,
+        seed,
+        evaluated=conversion_metrics(),
+    )
+
+
+@instrument.timed("bootstrap_intervals")
+def bootstrap_intervals(
+    number_of_days,
+    alpha,
+    resamples=10000,
+    seed=0,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+):
+    """ Day-level bootstrap intervals and permutation p-values of the
+    differences in every registered metric.
+    """
+    return _bootstrap_intervals(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        number_of_days,
+        alpha,
+        resamples,
+        seed,
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _load_segmented(stamp):
+    # Dimension columns are text, so these bypass the columnar cache
+    return pd.read_csv(stamp[0])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _segmented(
+    control_stamp, experiment_stamp, dimensions, number_of_days, alpha
+):
+    return segmented_analysis(
+        _load_segmented(control_stamp),
+        _load_segmented(experiment_stamp),
+        dimensions,
+        alpha,
+        number_of_days,
+        conversion_metrics(),
+    )
+
+
+@instrument.timed("segmented")
+def segmented(
+    dimensions,
+    number_of_days,
+    alpha,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+):
+    """ The analysis per segment of the given dimension columns. """
+    return _segmented(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        tuple(dimensions),
+        number_of_days,
+        alpha,
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _timeline(
+    control_stamp, experiment_stamp, alpha, d_min_gross_diff, d_min_net_diff
+):
+    return significance_timeline(
+        _load_group(control_stamp),
+        _load_group(experiment_stamp),
+        alpha,
+        conversion_metrics(d_min_gross_diff, d_min_net_diff),
+    )
+
+
+@instrument.timed("timeline")
+def timeline(
+    alpha,
+    d_min_gross_diff,
+    d_min_net_diff,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+):
+    """ The analysis for every number of days, one row per day count. """
+    return _timeline(
+        _stamp(control_path),
+        _stamp(experiment_path),
+        alpha,
+        d_min_gross_diff,
+        d_min_net_diff,
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _multi_arm(stamps, names, number_of_days, alpha, expected, correction):
+    return multi_arm_analysis(
+        [_load_group(stamp) for stamp in stamps],
+        names,
+        alpha,
+        number_of_days,
+        expected,
+        correction,
+        conversion_metrics(),
+    )
+
+
+@instrument.timed("multi_arm")
+def multi_arm(
+    paths,
+    number_of_days=None,
+    alpha=0.05,
+    names=None,
+    expected=None,
+    correction="bonferroni",
+):
+    """ The analysis of an A/B/n test, one CSV per arm, the control first.
+    """
+    return _multi_arm(
+        tuple(_stamp(path) for path in paths),
+        tuple(paths if names is None else names),
+        number_of_days,
+        alpha,
+        None if expected is None else tuple(expected),
+        correction,
+    )
+
+
+@instrument.timed("full_analysis")
+def full_analysis(
+    number_of_days=None,
+    alpha=0.05,
+    beta=0.2,
+    d_min_gross_diff=0.01,
+    d_min_net_diff=0.0075,
+    baseline_path=BASELINE_PATH,
+    control_path=CONTROL_PATH,
+    experiment_path=EXPERIMENT_PATH,
+):
+    """ Every table app.py shows, as a dict of name: table.
+
+    Like the app, the analysis runs for the calculated experiment duration
+    unless number_of_days is given, within the days there is data for.
+    """
+    sample_sizes, total_sample_size, experiment_duration = sizing(
+        alpha, beta, d_min_gross_diff, d_min_net_diff, baseline_path
+    )
+    max_days = len(load_group(control_path))
+    if number_of_days is None:
+        number_of_days = experiment_duration
+    number_of_days = min(max(number_of_days, 1), max_days)
+
+    paths = dict(control_path=control_path, experiment_path=experiment_path)
+    return {
+        "sample_sizes": sample_sizes,
+        "total_sample_size": total_sample_size,
+        "experiment_duration": experiment_duration,
+        "number_of_days": number_of_days,
+        "aggregated_data": aggregated_data(number_of_days, **paths),
+        "sanity_intervals": sanity_checks(number_of_days, alpha, **paths),
+        "conversions": conversions(number_of_days, **paths),
+        "confidence_intervals": confidence_intervals(
+            number_of_days, alpha, d_min_gross_diff, d_min_net_diff, **paths
+        ),
+        "p_values": sign_tests(number_of_days, alpha, **paths),
+    }
@@ -1,8 +1,18 @@
 import math
+import os
+import time
 import pandas as pd
-from scipy import stats
 import streamlit as st
 
+import analysis
+import instrument
+import store
+import watch
+from correction import METHODS as correction_methods
+
+# Keep the tables across restarts, unless ABTEST_STORE points elsewhere
+os.environ.setdefault("ABTEST_STORE", store.DEFAULT_PATH)
+
 st.title("Udacity A/B Testing Final Project")
 
 """
@@ -24,7 +34,16 @@ The screenshot below shows what the experiment looks like.*
 """
 from PIL import Image
 
-image = Image.open("screenshot.png")
+
+@st.cache(allow_output_mutation=True, max_entries=4)
+def load_image(path, mtime):
+    with instrument.stage("image_decode"):
+        image = Image.open(path)
+        image.load()
+    return image
+
+
+image = load_image("screenshot.png", os.path.getmtime("screenshot.png"))
 st.image(image, caption="The experimental pop-up", use_column_width=True)
 """
 *The hypothesis was that this might set clearer expectations for students upfront, thus reducing the number of frustrated students who left the free trial 
@@ -56,7 +75,7 @@ The next step is estimating the baseline variability of each evaluation metric.
 the experiment, and verify that the experiment is feasible.  Below are the rough estimates of the baseline values for each metric.
 """
 
-baseline_values = pd.read_csv("baseline.csv", names=["Metric", "Value"])
+baseline_values = analysis.load_baseline()
 baseline_values
 
 r"""
@@ -105,56 +124,22 @@ With this in mind the results are given below.
 
 The significance level and power used are standard picks, with $\alpha=.05$ and $\beta=.2$.
 """
-from sample_size import sample_size
-
 alpha = 0.05
 beta = 0.2
 
 d_min_gross_diff = 0.01
 d_min_net_diff = 0.0075
 
-gross_sample_size = (
-    sample_size(
-        alpha, 1 - beta, baseline_values.loc[4, "Value"], d_min_gross_diff,
-    )
-    * 2
-    / baseline_values.loc[3, "Value"]
-)
-
-net_sample_size = (
-    sample_size(
-        alpha, 1 - beta, baseline_values.loc[6, "Value"], d_min_net_diff,
-    )
-    * 2
-    / baseline_values.loc[3, "Value"]
-)
-
-# Index: metric columns: d_min, sample size
-sample_sizes = pd.DataFrame(
-    [
-        [
-            baseline_values.loc[4, "Value"],
-            d_min_gross_diff,
-            gross_sample_size,
-        ],
-        [baseline_values.loc[6, "Value"], d_min_net_diff, net_sample_size],
-    ],
-    columns=["Baseline value", "Minimum detectable difference", "Sample size"],
-    index=["Gross conversion", "Net conversion"],
+sample_sizes, total_sample_size, experiment_duration = analysis.sizing(
+    alpha, beta, d_min_gross_diff, d_min_net_diff
 )
 sample_sizes
 
-total_sample_size = math.ceil(max(gross_sample_size, net_sample_size))
-
 """
 The resulting sample size is $N_{pageviews}=""" + str(
     total_sample_size
 ) + """$. Due to implementation difference this number differs slightly from the original sample size calculator."""
 
-experiment_duration = math.ceil(
-    total_sample_size / baseline_values.loc[0, "Value"]
-)
-
 """
 ### Duration vs. exposure
 
@@ -186,7 +171,7 @@ test calculations, which I found strange.
 I consider the correct calculations to be based on the $n_{days}$ I calculated, so you will see my numbers based on that.
 However, if you adjust the number of days on the slider, you can match Udacity's results. The tables will update immediately.
 """
-max_days = len(pd.read_csv("control.csv"))
+max_days = len(analysis.load_group(analysis.CONTROL_PATH))
 number_of_days = st.slider(
     label="Number of days to run the experiment",
     min_value=1,
@@ -194,14 +179,16 @@ number_of_days = st.slider(
     value=experiment_duration,
 )
 
-control_data = pd.read_csv("control.csv")[:number_of_days]
+control_data = analysis.load_group(analysis.CONTROL_PATH).frame(number_of_days)
 
 """
 Below are the results for the control group.
 """
 control_data
 
-experiment_data = pd.read_csv("experiment.csv")[:number_of_days]
+experiment_data = analysis.load_group(analysis.EXPERIMENT_PATH).frame(
+    number_of_days
+)
 
 """
 And those for the experiment group.
@@ -219,109 +206,10 @@ Below is the aggregated data from the final results.
 (The slider should be on 37 days for the results to match Udacity's.)
 """
 
-# Control
-enrollments_cont = control_data["Enrollments"].sum()
-
-clicks_cont = control_data["Clicks"].sum()
-
-pageviews_cont = control_data["Pageviews"].sum()
-
-payments_cont = control_data["Payments"].sum()
-
-gross_conversion_cont = enrollments_cont / clicks_cont
-net_conversion_cont = payments_cont / clicks_cont
-
-
-# Experiment
-enrollments_exp = experiment_data["Enrollments"].sum()
-
-clicks_exp = experiment_data["Clicks"].sum()
-
-pageviews_exp = experiment_data["Pageviews"].sum()
-
-payments_exp = experiment_data["Payments"].sum()
-
-gross_conversion_exp = enrollments_exp / clicks_exp
-net_conversion_exp = payments_exp / clicks_exp
-
-raw_data = [
-    [pageviews_cont, clicks_cont, enrollments_cont, payments_cont],
-    [pageviews_exp, clicks_exp, enrollments_exp, payments_exp],
-]
-
-# Calculate totals
-raw_data.append([sum(x) for x in zip(raw_data[0], raw_data[1])])
-
-aggregated_data = pd.DataFrame(
-    raw_data,
-    columns=["Cookies", "Clicks", "Enrollments", "Payments"],
-    index=["Control", "Experiment", "Total"],
-)
+aggregated_data = analysis.aggregated_data(number_of_days)
 aggregated_data
 
-cookies_control = aggregated_data.loc["Control", "Cookies"]
-cookies_experiment = aggregated_data.loc["Experiment", "Cookies"]
-
-clicks_control = aggregated_data.loc["Control", "Clicks"]
-clicks_experiment = aggregated_data.loc["Experiment", "Clicks"]
-
-
-# Proportion of cookies in control
-cookies_control_proportion = cookies_control / (
-    cookies_control + cookies_experiment
-)
-m_cookies = stats.norm.ppf(1 - alpha / 2) * math.sqrt(
-    0.5 ** 2 / (cookies_control + cookies_experiment)
-)
-ci_cookies_low = 0.5 - m_cookies
-ci_cookies_high = 0.5 + m_cookies
-
-
-# Proportion of clicks in control
-# (probability that a click ends up in control)
-clicks_control_proportion = clicks_control / (
-    clicks_control + clicks_experiment
-)
-m_clicks = stats.norm.ppf(1 - alpha / 2) * math.sqrt(
-    0.5 ** 2 / (clicks_control + clicks_experiment)
-)
-ci_clicks_low = 0.5 - m_clicks
-ci_clicks_high = 0.5 + m_clicks
-
-if (
-    cookies_control_proportion > ci_cookies_low
-    and cookies_control_proportion < ci_cookies_high
-):
-    cookies_sanity_pass = "yes"
-else:
-    cookies_sanity_pass = "no"
-
-if (
-    clicks_control_proportion > ci_clicks_low
-    and clicks_control_proportion < ci_clicks_high
-):
-    clicks_sanity_pass = "yes"
-else:
-    clicks_sanity_pass = "no"
-
-sanity_intervals = pd.DataFrame(
-    [
-        [
-            ci_cookies_low,
-            ci_cookies_high,
-            cookies_control_proportion,
-            cookies_sanity_pass,
-        ],
-        [
-            ci_clicks_low,
-            ci_clicks_high,
-            clicks_control_proportion,
-            clicks_sanity_pass,
-        ],
-    ],
-    columns=["Lower bound", "Upper bound", "Observed", "Passes"],
-    index=["Cookies", "Clicks"],
-)
+sanity_intervals = analysis.sanity_checks(number_of_days, alpha)
 sanity_intervals
 
 
@@ -333,99 +221,26 @@ Both invariant metrics pass the sanity check. This confirms that the experiment
 The conversion values for both groups, together with the respective confidence interval calculated around them, are shown below.
 I decided not to use the Bonferroni correction as the evaluation metrics are correlated (since they represent different "levels" of the same funnel),
 and therefore the method might prove too conservative and make it harder to detect a change.
+If you want to see the effect of a correction anyway, pick one below: the confidence intervals and the sign tests
+then also show the p-values adjusted over both metrics, and whether they remain significant.
 
 (The slider should be on 23 days to match Udacity's results.)
 """
 
-conversion_data = [
-    [gross_conversion_cont, net_conversion_cont],
-    [gross_conversion_exp, net_conversion_exp],
-]
-
-# Create the pandas DataFrame
-conversions = pd.DataFrame(
-    conversion_data,
-    columns=["Gross conversion", "Net conversion"],
-    index=["Control", "Experiment"],
-)
-conversions
-
-pooled_probability_gross_conversion = (enrollments_cont + enrollments_exp) / (
-    clicks_cont + clicks_exp
+correction = st.selectbox(
+    "Multiple testing correction", ["none"] + list(correction_methods),
 )
+correction = None if correction == "none" else correction
 
-pooled_probability_net_conversion = (payments_cont + payments_exp) / (
-    clicks_cont + clicks_exp
-)
-
-alpha = 0.05
-critical_two_tailed = stats.norm.ppf(1 - alpha / 2)
-
-pooled_se_gross_conversion = math.sqrt(
-    pooled_probability_gross_conversion
-    * (1 - pooled_probability_gross_conversion)
-    * (1 / clicks_cont + 1 / clicks_exp)
-)
-margin_gross = critical_two_tailed * pooled_se_gross_conversion
+conversions = analysis.conversions(number_of_days)
+conversions
 
-pooled_se_net_conversion = math.sqrt(
-    pooled_probability_net_conversion
-    * (1 - pooled_probability_net_conversion)
-    * (1 / clicks_cont + 1 / clicks_exp)
-)
-margin_net = critical_two_tailed * pooled_se_net_conversion
-
-# initialize list of lists
-gross_diff = gross_conversion_exp - gross_conversion_cont
-net_diff = net_conversion_exp - net_conversion_cont
-
-if margin_gross < abs(gross_diff):
-    gross_stat_signif = "yes"
-else:
-    gross_stat_signif = "no"
-
-if d_min_gross_diff < min(
-    abs(gross_diff - margin_gross), abs(gross_diff + margin_gross)
-):
-    gross_pract_signif = "yes"
-else:
-    gross_pract_signif = "no"
-
-
-if margin_net < abs(net_diff):
-    net_stat_signif = "yes"
-else:
-    net_stat_signif = "no"
-
-if d_min_net_diff < min(
-    abs(net_diff - margin_net), abs(net_diff + margin_net)
-):
-    net_pract_signif = "yes"
-else:
-    net_pract_signif = "no"
-
-ci_data = [
-    [
-        gross_diff,
-        gross_diff - margin_gross,
-        gross_diff + margin_gross,
-        gross_stat_signif,
-        gross_pract_signif,
-    ],
-    [
-        net_diff,
-        net_diff - margin_net,
-        net_diff + margin_net,
-        net_stat_signif,
-        net_pract_signif,
-    ],
-]
-
-# Create the pandas DataFrame
-confidence_intervals = pd.DataFrame(
-    ci_data,
-    columns=["Difference", "Lower bound", "Upper bound", "S.", "P.",],
-    index=["Gross conversion", "Net conversion"],
+confidence_intervals = analysis.confidence_intervals(
+    number_of_days,
+    alpha,
+    d_min_gross_diff,
+    d_min_net_diff,
+    correction=correction,
 )
 confidence_intervals
 
@@ -441,38 +256,10 @@ Conversely, we expect the differences to be more or less evenly split between po
 since this is the metric we expected to not significantly move.
 """
 
-gross_conversion_diff = (
-    experiment_data["Enrollments"] / experiment_data["Clicks"]
-    - control_data["Enrollments"] / control_data["Clicks"]
-)
-net_conversion_diff = (
-    experiment_data["Payments"] / experiment_data["Clicks"]
-    - control_data["Payments"] / control_data["Clicks"]
-)
-daily_differences = pd.DataFrame(
-    {
-        "Date": control_data["Date"],
-        "Δ Gross conversion": gross_conversion_diff,
-        "Δ Net conversion": net_conversion_diff,
-    }
-)
+daily_differences = analysis.daily_differences(number_of_days)
 daily_differences
 
-p_value_sign_gross = stats.binom_test(
-    x=sum(x > 0 for x in gross_conversion_diff), n=number_of_days
-)
-p_value_sign_net = stats.binom_test(
-    x=sum(x > 0 for x in net_conversion_diff), n=number_of_days
-)
-p_values_data = [p_value_sign_gross, p_value_sign_net]
-
-p_values = pd.DataFrame(
-    {
-        "P-value": p_values_data,
-        "Significant": ["yes" if x < alpha else "no" for x in p_values_data],
-    },
-    index=["Gross conversion", "Net conversion"],
-)
+p_values = analysis.sign_tests(number_of_days, alpha, correction=correction)
 p_values
 
 """
@@ -525,3 +312,69 @@ However, net conversion would allow us to draw a conclusion with far fewer sampl
 For the experiment to be a success, we should see net conversion increasing significantly.
 Otherwise, the changes should not be rolled out to everyone.
 """
+# Recording is switched on for the whole server with ABTEST_INSTRUMENT=1,
+# the checkbox only shows what has been recorded
+if instrument.enabled() and st.sidebar.checkbox("Show timings and counters"):
+    st.sidebar.markdown("## Timings")
+    timings = instrument.snapshot()
+    if timings["timers"]:
+        st.sidebar.dataframe(
+            pd.DataFrame.from_dict(timings["timers"], orient="index")
+        )
+    st.sidebar.json(dict(timings["counters"]))
+    if st.sidebar.checkbox("Prometheus text"):
+        st.sidebar.text(instrument.to_prometheus())
+    if st.sidebar.button("Reset"):
+        instrument.reset()
+
+
+@st.cache(allow_output_mutation=True, max_entries=4)
+def live_analysis(alpha, d_min_gross_diff, d_min_net_diff):
+    return watch.LiveAnalysis(
+        analysis.CONTROL_PATH,
+        analysis.EXPERIMENT_PATH,
+        alpha,
+        d_min_gross_diff,
+        d_min_net_diff,
+    )
+
+
+if st.sidebar.checkbox("Watch the CSVs for new days"):
+    poll_seconds = st.sidebar.number_input(
+        "Seconds between checks", min_value=1, value=10
+    )
+
+    """
+    ## Live results
+    The experiment CSVs are checked for appended days, and the tables below are updated with every day present in both groups,
+    without reading the earlier days again.
+    """
+    live = live_analysis(alpha, d_min_gross_diff, d_min_net_diff)
+    live.refresh()
+    placeholders = {
+        name: st.empty()
+        for name in [
+            "status",
+            "number_of_days",
+            "aggregated_data",
+            "sanity_intervals",
+            "confidence_intervals",
+            "p_values",
+        ]
+    }
+    while True:
+        tables = live.tables()
+        placeholders["number_of_days"].markdown(
+            "Days analyzed: {}".format(tables.pop("number_of_days"))
+        )
+        for name, table in tables.items():
+            placeholders[name].dataframe(table)
+        # Writing the status on every check lets Streamlit stop or rerun
+        # the script between checks, so the widgets stay responsive
+        while not live.refresh():
+            placeholders["status"].text(
+                "Last checked for new days at {}".format(
+                    time.strftime("%H:%M:%S")
+                )
+            )
+            time.sleep(poll_seconds)
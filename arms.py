@@ -0,0 +1,134 @@
+""" The analysis from app.py for experiments with any number of arms.
+
+The first arm is the control, and every other arm is compared against it.
+The totals of all arms are stacked into one arms x columns array, so the
+sanity checks, confidence intervals and sign tests of all comparisons come
+from the same array operations as a single A/B test, with the treatment
+arms as an extra axis. With correction="bonferroni", alpha is split over
+the arms - 1 comparisons, matching the sizing of sample_size with arms.
+
+    multi_arm_analysis([control, variant_b, variant_c], ["A", "B", "C"])
+"""
+import numpy as np
+
+import metrics
+from aggregator import COLUMNS
+from lazyimport import lazy_import
+from signtest import sign_test
+from srm import srm_test
+
+pd = lazy_import("pandas")
+
+INVARIANTS = [("Cookies", "Pageviews"), ("Clicks", "Clicks")]
+CORRECTIONS = (None, "bonferroni")
+
+
+def stack_arms(groups, number_of_days=None):
+    """ Daily counts of every arm, arms x days x columns, over shared days.
+
+    groups are DailyAggregators; only the days all of them have are kept.
+    """
+    days = min(len(group) for group in groups)
+    if number_of_days is not None:
+        days = min(days, number_of_days)
+    return np.stack([group.values(days) for group in groups])
+
+
+def multi_arm_analysis(
+    groups,
+    names=None,
+    alpha=0.05,
+    number_of_days=None,
+    expected=None,
+    correction="bonferroni",
+    evaluated=None,
+):
+    """ Aggregated data, sanity checks, intervals and sign tests of N arms.
+
+    groups are DailyAggregators, the control first, names their labels and
+    expected the planned traffic split (equal by default). Returns a dict
+    of tables; the comparisons are indexed by (metric, arm).
+    """
+    if correction not in CORRECTIONS:
+        raise ValueError("correction must be None or bonferroni")
+    if len(groups) < 2:
+        raise ValueError("an experiment needs at least two arms")
+    evaluated = metrics.registered() if evaluated is None else evaluated
+    names = (
+        ["Arm {}".format(arm) for arm in range(len(groups))]
+        if names is None
+        else list(names)
+    )
+    comparison_alpha = alpha
+    if correction == "bonferroni":
+        comparison_alpha = alpha / (len(groups) - 1)
+
+    daily = stack_arms(groups, number_of_days)
+    totals = np.nansum(daily, axis=1)
+    control, treatments = totals[0], totals[1:]
+
+    aggregated = pd.DataFrame(
+        np.vstack([totals, totals.sum(axis=0)]).astype(np.int64),
+        index=names + ["Total"],
+        columns=["Cookies", "Clicks", "Enrollments", "Payments"],
+    )
+
+    # Sanity checks: the split of each invariant over all arms
+    counts = totals[:, [COLUMNS.index(column) for _, column in INVARIANTS]]
+    split = srm_test(counts.T, expected)
+    sanity = pd.DataFrame(
+        split["Observed share"],
+        index=[invariant for invariant, _ in INVARIANTS],
+        columns=[name + " share" for name in names],
+    )
+    for column in ["Chi-square p-value", "Binomial p-value"]:
+        sanity[column] = split[column]
+    sanity["Passes"] = np.where(
+        (split["Chi-square p-value"] >= alpha)
+        & (split["Binomial p-value"] >= alpha),
+        "yes",
+        "no",
+    )
+
+    # Every treatment arm against the control, metrics x treatment arms
+    comparisons = pd.MultiIndex.from_product(
+        [[metric.name for metric in evaluated], names[1:]],
+        names=["Metric", "Arm"],
+    )
+    result = metrics.evaluate(
+        np.broadcast_to(control, treatments.shape),
+        treatments,
+        COLUMNS,
+        comparison_alpha,
+        evaluated,
+    )
+    intervals = pd.DataFrame(
+        {
+            column: result[column].ravel()
+            for column in ["Difference", "Lower bound", "Upper bound"]
+        },
+        index=comparisons,
+    )
+    for column in ["S.", "P."]:
+        intervals[column] = np.where(result[column].ravel(), "yes", "no")
+    intervals["P-value"] = result["P-value"].ravel()
+
+    # Daily differences, metrics x treatment arms x days
+    differences = metrics.daily_differences(
+        np.broadcast_to(daily[0], daily[1:].shape),
+        daily[1:],
+        COLUMNS,
+        evaluated,
+    )
+    signs = sign_test(
+        differences.reshape(-1, differences.shape[-1]),
+        comparison_alpha,
+        index=comparisons,
+    )
+
+    return {
+        "aggregated_data": aggregated,
+        "sanity_checks": sanity,
+        "confidence_intervals": intervals,
+        "sign_tests": signs,
+    }
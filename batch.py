@@ -0,0 +1,221 @@
+""" Run the analysis from app.py on many experiments at once.
+
+Experiments are given either as a directory, holding one sub-directory per
+experiment with a control.csv and an experiment.csv (or <name>_control.csv
+and <name>_experiment.csv file pairs), or as a manifest CSV with the columns
+Name, Control and Experiment. Every experiment is analyzed in a process
+pool, and the results are collected into one table with a row per
+experiment. An experiment that fails to load or analyze gets its error
+message in the Error column instead of stopping the batch.
+
+    python batch.py experiments/ --days 23 --output results.csv
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import analysis
+from correction import METHODS, adjust
+
+
+MANIFEST_COLUMNS = ("Name", "Control", "Experiment")
+
+
+def _manifest_path(root, value):
+    # Blank cells are read as NaN, and left for analyze_experiment to report
+    if isinstance(value, str) and value.strip():
+        return os.path.join(root, value.strip())
+    return None
+
+
+def find_experiments(source):
+    """ List of (name, control path, experiment path) for a directory or
+    manifest. A manifest row without a file gets None for its path.
+    """
+    if os.path.isfile(source):
+        manifest = pd.read_csv(source, dtype=str)
+        missing = [
+            column
+            for column in MANIFEST_COLUMNS
+            if column not in manifest.columns
+        ]
+        if missing:
+            raise ValueError(
+                "{} has no {} column".format(source, ", ".join(missing))
+            )
+        root = os.path.dirname(source)
+        return [
+            (
+                str(row.Name),
+                _manifest_path(root, row.Control),
+                _manifest_path(root, row.Experiment),
+            )
+            for row in manifest.itertuples()
+        ]
+
+    experiments = []
+    for entry in sorted(os.listdir(source)):
+        path = os.path.join(source, entry)
+        if os.path.isdir(path):
+            experiments.append(
+                (
+                    entry,
+                    os.path.join(path, "control.csv"),
+                    os.path.join(path, "experiment.csv"),
+                )
+            )
+        elif entry.endswith("_control.csv"):
+            name = entry[: -len("_control.csv")]
+            experiments.append(
+                (name, path, os.path.join(source, name + "_experiment.csv"),)
+            )
+    return experiments
+
+
+def analyze_experiment(
+    experiment,
+    number_of_days=None,
+    alpha=0.05,
+    d_min_gross_diff=0.01,
+    d_min_net_diff=0.0075,
+):
+    """ Flat result row for one (name, control path, experiment path). """
+    name, control_path, experiment_path = experiment
+    row = {"Experiment": name}
+    try:
+        if control_path is None or experiment_path is None:
+            raise ValueError("no control or experiment file")
+        paths = dict(
+            control_path=control_path, experiment_path=experiment_path
+        )
+        days = len(analysis.load_group(control_path))
+        if number_of_days is not None:
+            days = min(days, number_of_days)
+        row["Days"] = days
+
+        sanity_intervals = analysis.sanity_checks(days, alpha, **paths)
+        for invariant, result in sanity_intervals.iterrows():
+            row[invariant + " observed"] = result["Observed"]
+            row[invariant + " passes"] = result["Passes"]
+
+        confidence_intervals = analysis.confidence_intervals(
+            days, alpha, d_min_gross_diff, d_min_net_diff, **paths
+        )
+        p_values = analysis.sign_tests(days, alpha, **paths)
+        for metric, result in confidence_intervals.iterrows():
+            row[metric + " difference"] = result["Difference"]
+            row[metric + " lower bound"] = result["Lower bound"]
+            row[metric + " upper bound"] = result["Upper bound"]
+            row[metric + " S."] = result["S."]
+            row[metric + " P."] = result["P."]
+            row[metric + " p-value"] = result["P-value"]
+            row[metric + " sign test p-value"] = p_values.loc[
+                metric, "P-value"
+            ]
+        row["Error"] = ""
+    except Exception as error:
+        row["Error"] = "{}: {}".format(type(error).__name__, error)
+    return row
+
+
+def run_batch(experiments, workers=None, **parameters):
+    """ Analyze all experiments in a process pool, one row per experiment.
+
+    The keyword parameters are passed on to analyze_experiment.
+    """
+    experiments = list(experiments)
+    if not experiments:
+        return pd.DataFrame()
+
+    # Hand out experiments in chunks, so small files don't drown in IPC
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(experiments) // (4 * workers))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(
+            executor.map(
+                partial(analyze_experiment, **parameters),
+                experiments,
+                chunksize=chunksize,
+            )
+        )
+    return pd.DataFrame(rows).set_index("Experiment")
+
+
+def correct_batch(results, alpha=0.05, method="holm"):
+    """ Copy of batch results with p-values adjusted across the batch.
+
+    The z-test p-values of all experiments and metrics form one family, and
+    the sign test p-values another.
+    """
+    results = results.copy()
+    z_tests = [
+        column
+        for column in results.columns
+        if column.endswith(" p-value") and "sign test" not in column
+    ]
+    sign_tests = [
+        column
+        for column in results.columns
+        if column.endswith(" sign test p-value")
+    ]
+    for columns in [z_tests, sign_tests]:
+        adjusted = adjust(results[columns].values.astype(float), method)
+        for index, column in enumerate(columns):
+            prefix = column[: -len("p-value")]
+            results[prefix + "adjusted p-value"] = adjusted[:, index]
+            results[prefix + "adjusted significant"] = np.where(
+                adjusted[:, index] < alpha, "yes", "no"
+            )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "source", help="directory of experiments or a manifest CSV"
+    )
+    parser.add_argument(
+        "--days", type=int, default=None, help="days to analyze (all)"
+    )
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--d-min-gross", type=float, default=0.01)
+    parser.add_argument("--d-min-net", type=float, default=0.0075)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--correction",
+        choices=METHODS,
+        default=None,
+        help="adjust the p-values across the whole batch",
+    )
+    parser.add_argument(
+        "--output", default=None, help="CSV file for the results (stdout)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        experiments = find_experiments(args.source)
+    except ValueError as error:
+        parser.error(str(error))
+    results = run_batch(
+        experiments,
+        workers=args.workers,
+        number_of_days=args.days,
+        alpha=args.alpha,
+        d_min_gross_diff=args.d_min_gross,
+        d_min_net_diff=args.d_min_net,
+    )
+    if args.correction and len(results):
+        results = correct_batch(results, args.alpha, args.correction)
+    if args.output:
+        results.to_csv(args.output)
+    else:
+        print(results.to_csv(), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+""" Benchmarks for the sizing and analysis hot paths.
+
+Synthetic control/experiment CSVs with the schema of control.csv are
+generated for the requested number of days and experiments, and every stage
+is timed on its own. Each stage prints one JSON object per line, with its
+wall time, throughput and peak traced memory, so the results can be
+collected and compared between runs.
+
+    python benchmark.py --days 365 --experiments 100 --metrics 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import datacache
+import metrics
+from aggregator import COLUMNS, DailyAggregator
+from sample_size import batch_sample_size, sample_size
+from signtest import sign_test
+from timeline import significance_timeline
+
+# Daily rates of baseline.csv
+BASELINE_PAGEVIEWS_PER_DAY = 40000
+# The experiment ran on about half of that traffic, split over its two
+# groups: control.csv and experiment.csv average about 9,300 pageviews per
+# day each, close to a quarter of the baseline
+GROUP_SHARE = 0.25
+PAGEVIEWS_PER_DAY = BASELINE_PAGEVIEWS_PER_DAY * GROUP_SHARE
+CLICK_THROUGH = 0.08
+ENROLL_GIVEN_CLICK = 0.20625
+PAY_GIVEN_ENROLL = 0.53
+
+
+def synthetic_group(days, rng, effect=1.0):
+    """ Daily data shaped like control.csv, drawn from the baseline rates.
+    """
+    start = date(2014, 10, 11)
+    pageviews = rng.poisson(PAGEVIEWS_PER_DAY, days)
+    clicks = rng.binomial(pageviews, CLICK_THROUGH)
+    enrollments = rng.binomial(clicks, ENROLL_GIVEN_CLICK * effect)
+    payments = rng.binomial(enrollments, PAY_GIVEN_ENROLL)
+    return pd.DataFrame(
+        {
+            "Date": [
+                "{:%a, %b} {}".format(day, day.day)
+                for day in (start + timedelta(days=n) for n in range(days))
+            ],
+            "Pageviews": pageviews,
+            "Clicks": clicks,
+            "Enrollments": enrollments,
+            "Payments": payments,
+        }
+    )
+
+
+def write_dataset(directory, days, experiments, seed=0):
+    """ Write experiments control/experiment CSV pairs, return their paths.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for experiment in range(experiments):
+        control_path = os.path.join(
+            directory, "{}_control.csv".format(experiment)
+        )
+        experiment_path = os.path.join(
+            directory, "{}_experiment.csv".format(experiment)
+        )
+        synthetic_group(days, rng).to_csv(control_path, index=False)
+        synthetic_group(days, rng, effect=0.95).to_csv(
+            experiment_path, index=False
+        )
+        pairs.append((control_path, experiment_path))
+    return pairs
+
+
+def synthetic_metrics(count):
+    """ count ratio metrics over the CSV columns, for the metric stages. """
+    pairs = [
+        (numerator, denominator)
+        for index, denominator in enumerate(COLUMNS)
+        for numerator in COLUMNS[index + 1 :]
+    ]
+    return tuple(
+        metrics.RatioMetric(
+            "Metric {}".format(index), *pairs[index % len(pairs)], d_min=0.01
+        )
+        for index in range(count)
+    )
+
+
+def measure(stage, items, function, repeat=1):
+    """ Time function (best of repeat) and trace its peak memory. """
+    # Warm up first, so that lazy imports and caches don't count
+    function()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "stage": stage,
+        "items": items,
+        "seconds": best,
+        "items_per_second": items / best if best > 0 else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run(days, experiments, metric_count, sizes, repeat=3, seed=0):
+    """ Run every stage and return one result dict per stage. """
+    results = []
+    rng = np.random.default_rng(seed)
+    alpha = 0.05
+
+    # Sizing
+    baselines = rng.uniform(0.05, 0.5, sizes)
+    deltas = rng.uniform(0.005, 0.05, sizes)
+    results.append(
+        measure(
+            "sample_size",
+            sizes,
+            lambda: [
+                sample_size(alpha, 0.8, baseline, delta)
+                for baseline, delta in zip(baselines, deltas)
+            ],
+            repeat,
+        )
+    )
+    results.append(
+        measure(
+            "batch_sample_size",
+            sizes,
+            lambda: batch_sample_size(alpha, 0.8, baselines, deltas),
+            repeat,
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        pairs = write_dataset(directory, days, experiments, seed)
+        paths = [path for pair in pairs for path in pair]
+        rows = days * len(paths)
+
+        # Loading
+        results.append(
+            measure(
+                "read_csv",
+                rows,
+                lambda: [pd.read_csv(path) for path in paths],
+                repeat,
+            )
+        )
+        for path in paths:
+            datacache.load_columns(path)
+        results.append(
+            measure(
+                "columnar_cache",
+                rows,
+                lambda: [datacache.load_frame(path) for path in paths],
+                repeat,
+            )
+        )
+        groups = [
+            (
+                DailyAggregator.from_frame(datacache.load_frame(control)),
+                DailyAggregator.from_frame(datacache.load_frame(experiment)),
+            )
+            for control, experiment in pairs
+        ]
+
+    # Analysis
+    evaluated = synthetic_metrics(metric_count)
+    controls = np.array([control.totals().values for control, _ in groups])
+    treatments = np.array([treated.totals().values for _, treated in groups])
+    aggregated = [
+        analysis.aggregated_table(control.totals(), treated.totals())
+        for control, treated in groups
+    ]
+
+    results.append(
+        measure(
+            "sanity_checks",
+            experiments,
+            lambda: [
+                analysis.sanity_table(table, alpha) for table in aggregated
+            ],
+            repeat,
+        )
+    )
+    results.append(
+        measure(
+            "confidence_intervals",
+            experiments * metric_count,
+            lambda: metrics.evaluate(
+                controls, treatments, COLUMNS, alpha, evaluated
+            ),
+            repeat,
+        )
+    )
+
+    differences = np.concatenate(
+        [
+            metrics.daily_differences(
+                control.values(), treated.values(), COLUMNS, evaluated
+            )
+            for control, treated in groups
+        ]
+    )
+    results.append(
+        measure(
+            "sign_tests",
+            len(differences),
+            lambda: sign_test(differences, alpha),
+            repeat,
+        )
+    )
+    results.append(
+        measure(
+            "timeline",
+            experiments * days,
+            lambda: [
+                significance_timeline(control, treated, alpha, evaluated)
+                for control, treated in groups
+            ],
+            repeat,
+        )
+    )
+
+    for result in results:
+        result.update(days=days, experiments=experiments, metrics=metric_count)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--days", type=int, default=37)
+    parser.add_argument("--experiments", type=int, default=10)
+    parser.add_argument("--metrics", type=int, default=2)
+    parser.add_argument(
+        "--sizes", type=int, default=1000, help="sizing inputs to time"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", default=None, help="JSON lines file (stdout)"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.days,
+        args.experiments,
+        args.metrics,
+        args.sizes,
+        args.repeat,
+        args.seed,
+    )
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+""" Command line interface to the sizing and analysis, with JSON output.
+
+Only the modules a command needs are imported, and pandas and scipy only
+when they are first used, so short jobs start fast.
+
+    python cli.py size --baseline 0.20625 --delta 0.01 0.02
+    python cli.py analyze --control control.csv --experiment experiment.csv
+
+The modules stay flat at the top of the repo, next to app.py, which
+Streamlit runs as a script. To use them from elsewhere, run the directory
+(see __main__.py), e.g. python path/to/repo size ..., or import them with
+the repo on sys.path.
+"""
+import argparse
+import json
+import sys
+
+
+def to_json(value):
+    """ JSON-ready form of the tables and numpy values in a result. """
+    if hasattr(value, "to_dict"):
+        return {
+            str(index): {
+                str(column): to_json(cell) for column, cell in row.items()
+            }
+            for index, row in value.to_dict(orient="index").items()
+        }
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if hasattr(value, "tolist"):
+        return to_json(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def size_rows(alpha, power, baselines, deltas, arms=2):
+    """ One row per baseline and delta, with its sample size per arm. """
+    from sample_size import batch_sample_size
+
+    sizes = batch_sample_size(
+        alpha, power, [[baseline] for baseline in baselines], [deltas], arms
+    )
+    return [
+        {
+            "alpha": alpha,
+            "power": power,
+            "baseline": baseline,
+            "delta": delta,
+            "arms": arms,
+            "sample_size": int(sizes[row, column]),
+        }
+        for row, baseline in enumerate(baselines)
+        for column, delta in enumerate(deltas)
+    ]
+
+
+def size(args):
+    return size_rows(
+        args.alpha, args.power, args.baseline, args.delta, args.arms
+    )
+
+
+def analyze(args):
+    import analysis
+
+    result = analysis.full_analysis(
+        number_of_days=args.days,
+        alpha=args.alpha,
+        beta=args.beta,
+        d_min_gross_diff=args.d_min_gross,
+        d_min_net_diff=args.d_min_net,
+        baseline_path=args.baseline,
+        control_path=args.control,
+        experiment_path=args.experiment,
+    )
+    if args.arm:
+        result["arms"] = analysis.multi_arm(
+            [args.control, args.experiment] + args.arm,
+            result["number_of_days"],
+            args.alpha,
+        )
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--instrument",
+        choices=["json", "prometheus"],
+        default=None,
+        help="write stage timings and counters to stderr",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    size_parser = commands.add_parser(
+        "size", help="sample sizes for every baseline and delta"
+    )
+    size_parser.add_argument("--alpha", type=float, default=0.05)
+    size_parser.add_argument("--power", type=float, default=0.8)
+    size_parser.add_argument(
+        "--baseline", type=float, nargs="+", required=True
+    )
+    size_parser.add_argument("--delta", type=float, nargs="+", required=True)
+    size_parser.add_argument(
+        "--arms", type=int, default=2, help="arms, including control"
+    )
+    size_parser.set_defaults(run=size)
+
+    analyze_parser = commands.add_parser(
+        "analyze", help="sizing, sanity checks and significance tables"
+    )
+    analyze_parser.add_argument("--baseline", default="baseline.csv")
+    analyze_parser.add_argument("--control", default="control.csv")
+    analyze_parser.add_argument("--experiment", default="experiment.csv")
+    analyze_parser.add_argument(
+        "--arm",
+        action="append",
+        default=[],
+        help="CSV of a further arm, compared against control (repeatable)",
+    )
+    analyze_parser.add_argument(
+        "--days", type=int, default=None, help="days to analyze (duration)"
+    )
+    analyze_parser.add_argument("--alpha", type=float, default=0.05)
+    analyze_parser.add_argument("--beta", type=float, default=0.2)
+    analyze_parser.add_argument("--d-min-gross", type=float, default=0.01)
+    analyze_parser.add_argument("--d-min-net", type=float, default=0.0075)
+    analyze_parser.set_defaults(run=analyze)
+
+    args = parser.parse_args(argv)
+    if args.instrument:
+        import instrument
+
+        instrument.enable()
+    json.dump(to_json(args.run(args)), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    if args.instrument == "json":
+        sys.stderr.write(instrument.to_json() + "\n")
+    elif args.instrument == "prometheus":
+        sys.stderr.write(instrument.to_prometheus())
+
+
+if __name__ == "__main__":
+    main()
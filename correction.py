@@ -0,0 +1,56 @@
+""" Multiple testing corrections for large arrays of p-values.
+
+    adjusted = adjust(p_values, "holm")
+    significant = adjusted < alpha
+
+Bonferroni and Holm control the family-wise error rate, Benjamini-Hochberg
+("bh") the false discovery rate. The adjusted p-values come from one sort
+and a cumulative maximum or minimum, so the cost is O(n log n) for any
+number of tests. Missing p-values (NaN) are left out of the family and stay
+missing.
+"""
+import numpy as np
+
+METHODS = ("bonferroni", "holm", "bh")
+
+
+def adjust(p_values, method="holm"):
+    """ Adjusted p-values, in the shape of p_values. """
+    if method not in METHODS:
+        raise ValueError("method must be one of {}".format(", ".join(METHODS)))
+    p_values = np.asarray(p_values, dtype=float)
+    flat = p_values.ravel()
+    present = np.flatnonzero(~np.isnan(flat))
+    tests = len(present)
+    adjusted = np.full(flat.shape, np.nan)
+
+    if method == "bonferroni":
+        adjusted[present] = flat[present] * tests
+    else:
+        order = present[np.argsort(flat[present])]
+        ranked = flat[order]
+        if method == "holm":
+            # The k-th smallest (from 0) is scaled by tests - k, and an
+            # adjusted p-value never falls below a smaller one's
+            scaled = ranked * (tests - np.arange(tests))
+            adjusted[order] = np.maximum.accumulate(scaled)
+        else:
+            # The k-th smallest (from 1) is scaled by tests / k, and an
+            # adjusted p-value never rises above a larger one's
+            scaled = ranked * tests / np.arange(1, tests + 1)
+            adjusted[order] = np.minimum.accumulate(scaled[::-1])[::-1]
+
+    return np.minimum(adjusted, 1.0).reshape(p_values.shape)
+
+
+def correct_table(table, alpha=0.05, method="holm", p_column="P-value"):
+    """ Copy of a table of tests with adjusted p-values and significance.
+
+    All rows of the table form one family. Adds the columns "Adjusted
+    p-value" and "Adjusted significant".
+    """
+    table = table.copy()
+    adjusted = adjust(table[p_column].values.astype(float), method)
+    table["Adjusted p-value"] = adjusted
+    table["Adjusted significant"] = np.where(adjusted < alpha, "yes", "no")
+    return table
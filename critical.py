@@ -0,0 +1,85 @@
+""" Shared critical values of the standard normal distribution.
+
+Every z-test in the analysis gets its critical value from here. The
+quantiles of the usual significance levels and powers are precomputed in
+QUANTILES, and any other quantile is computed once with scipy and memoized,
+so repeated analyses with a handful of settings never call scipy again.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+import instrument
+from lazyimport import lazy_import
+
+stats = lazy_import("scipy.stats")
+
+# stats.norm.ppf(p) for 1 - alpha / 2 and 1 - alpha with alpha in
+# (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.2), and the usual powers
+QUANTILES = {
+    0.5: 0.0,
+    0.8: 0.8416212335729143,
+    0.85: 1.0364333894937898,
+    0.9: 1.2815515655446004,
+    0.95: 1.6448536269514722,
+    0.975: 1.959963984540054,
+    0.9875: 2.241402727604947,
+    0.99: 2.3263478740408408,
+    0.995: 2.5758293035489004,
+    0.9975: 2.807033768343811,
+    0.999: 3.090232306167813,
+    0.9995: 3.2905267314919255,
+}
+
+CORRECTIONS = ("none", "bonferroni", "holm")
+
+
+@lru_cache(maxsize=1024)
+def _quantile(probability):
+    key = round(probability, 12)
+    if key in QUANTILES:
+        return QUANTILES[key]
+    instrument.count("scipy_calls")
+    return float(stats.norm.ppf(probability))
+
+
+def quantile(probability):
+    """ stats.norm.ppf(probability), for a number or an array. """
+    if np.ndim(probability) == 0:
+        return _quantile(float(probability))
+    # Look up every distinct probability once
+    unique, inverse = np.unique(
+        np.asarray(probability, dtype=float), return_inverse=True
+    )
+    values = np.array([_quantile(value) for value in unique])
+    return values[inverse].reshape(np.shape(probability))
+
+
+def critical_value(alpha, tails=2, tests=1, correction="none", rank=0):
+    """ Critical value of a z-test at significance level alpha.
+
+    tails is 2 for a two-sided and 1 for a one-sided test. With
+    correction="bonferroni", alpha is split over the given number of tests.
+    With correction="holm", the test whose p-value has the given rank
+    (counting from 0 for the smallest) is compared at alpha / (tests - rank),
+    Holm's step-down level.
+    """
+    if correction not in CORRECTIONS:
+        raise ValueError(
+            "correction must be one of {}".format(", ".join(CORRECTIONS))
+        )
+    if tails not in (1, 2):
+        raise ValueError("tails must be 1 or 2")
+    if correction == "bonferroni":
+        alpha = alpha / tests
+    elif correction == "holm":
+        alpha = alpha / (tests - np.asarray(rank))
+    return quantile(1 - alpha / tails)
+
+
+def holm_critical_values(alpha, tests, tails=2):
+    """ Holm's step-down critical values, for the smallest p-value first.
+    """
+    return critical_value(
+        alpha, tails, tests, correction="holm", rank=np.arange(tests)
+    )
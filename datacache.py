@@ -0,0 +1,172 @@
+""" Columnar binary cache for the daily experiment CSVs.
+
+The first time a CSV like control.csv is loaded, its columns are written
+next to it as control.csv.cols, and later loads memory-map that file
+instead of parsing text. The header records the size and modification
+time of the CSV it was built from, and the cache is rebuilt unless both
+still match exactly.
+
+The file is a small JSON header followed by one contiguous, aligned array
+per column: the date labels as fixed-width strings, and every other column
+in the type pandas reads it as, e.g. int64 for complete counts and float64
+with NaN for counts with missing days (enrollments after Nov 2). Labels
+that include a year are also parsed, into a Day column of datetime64[D];
+labels like "Sat, Oct 11" are kept as they are. CSVs with text columns
+besides Date are not cached, and parsed on every load.
+"""
+import json
+import os
+import re
+import struct
+import numpy as np
+
+import instrument
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+
+MAGIC = b"ABCOLS2\n"
+ALIGNMENT = 64
+SUFFIX = ".cols"
+
+_SHORT_DATE = re.compile(r"^\w{3}, \w{3} \d{1,2}$")
+
+
+def parse_dates(labels):
+    """ Parse date labels into datetime64[D], or None without a year.
+
+    Labels like "Sat, Oct 11" don't say which year they are from, so they
+    are not parsed at all rather than given a guessed year.
+    """
+    labels = list(labels)
+    if not labels or any(_SHORT_DATE.match(str(label)) for label in labels):
+        return None
+    try:
+        return pd.to_datetime(labels).values.astype("datetime64[D]")
+    except (TypeError, ValueError):
+        return None
+
+
+def _arrays(data):
+    """ The columns of a daily CSV as arrays, by name, in cache types. """
+    arrays = {}
+    for name in data.columns:
+        if name == "Date":
+            arrays[name] = np.asarray(data[name].astype(str), dtype=str)
+            days = parse_dates(arrays[name])
+            if days is not None:
+                arrays["Day"] = days
+        else:
+            # The type pandas parsed: int64, float64 with NaN for gaps, or
+            # objects for text
+            arrays[name] = data[name].to_numpy()
+    return arrays
+
+
+def _has_text(arrays):
+    return any(array.dtype.kind == "O" for array in arrays.values())
+
+
+def cache_path(csv_path):
+    return csv_path + SUFFIX
+
+
+def _source(csv_path):
+    """ Size and modification time of a CSV, to match against a cache. """
+    stat = os.stat(csv_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_cache(data, path, source=None):
+    """ Write the columns of a DataFrame to a columnar cache file.
+
+    source is the _source of the CSV the data was read from.
+    """
+    columns = []
+    arrays = []
+    offset = 0
+    for name, array in _arrays(data).items():
+        array = np.ascontiguousarray(array)
+        columns.append(
+            {"name": name, "dtype": array.dtype.str, "offset": offset}
+        )
+        arrays.append(array)
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps(
+        {"rows": len(data), "source": source, "columns": columns}
+    ).encode()
+    # Column offsets count from the first aligned byte after the header
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    # Write next to the target and swap it in, so readers never see a
+    # partially written file
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as cache:
+        cache.write(MAGIC)
+        cache.write(struct.pack("<Q", len(header)))
+        cache.write(header)
+        for column, array in zip(columns, arrays):
+            cache.seek(start + column["offset"])
+            cache.write(array.tobytes())
+    os.replace(temporary, path)
+
+
+def read_cache(path, source=None):
+    """ Memory-map a cache file into a dict of read-only column arrays.
+
+    The arrays are views into the mapped file; nothing is copied. With a
+    source, a cache built from a different version of the CSV raises
+    ValueError.
+    """
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buffer[: len(MAGIC)]) != MAGIC:
+        raise ValueError("{} is not a column cache file".format(path))
+    (length,) = struct.unpack("<Q", bytes(buffer[len(MAGIC) : len(MAGIC) + 8]))
+    header_end = len(MAGIC) + 8 + length
+    header = json.loads(bytes(buffer[len(MAGIC) + 8 : header_end]).decode())
+    start = -(-header_end // ALIGNMENT) * ALIGNMENT
+    if source is not None and header["source"] != source:
+        raise ValueError("{} is out of date".format(path))
+
+    columns = {}
+    for column in header["columns"]:
+        dtype = np.dtype(column["dtype"])
+        begin = start + column["offset"]
+        columns[column["name"]] = buffer[
+            begin : begin + header["rows"] * dtype.itemsize
+        ].view(dtype)
+    return columns
+
+
+def load_columns(csv_path):
+    """ The columns of a daily CSV, from its cache, rebuilt when stale. """
+    path = cache_path(csv_path)
+    source = _source(csv_path)
+    try:
+        columns = read_cache(path, source)
+    except (OSError, ValueError):
+        columns = None
+    if columns is not None:
+        instrument.count("columnar_cache_hits")
+        return columns
+
+    instrument.count("columnar_cache_misses")
+    data = pd.read_csv(csv_path)
+    instrument.count("rows_parsed", len(data))
+    arrays = _arrays(data)
+    if _has_text(arrays):
+        # Text columns, like the dimensions of a segmented analysis, don't
+        # fit a fixed-width file: parse the CSV every time instead
+        return arrays
+    try:
+        write_cache(data, path, source)
+    except OSError:
+        # Read-only data directory: parse the CSV every time instead
+        return arrays
+    return read_cache(path)
+
+
+def load_frame(csv_path):
+    """ A daily CSV as a DataFrame, with a parsed Day if Date has years. """
+    return pd.DataFrame(load_columns(csv_path), copy=False)
@@ -0,0 +1,167 @@
+""" Opt-in timers and counters for the analysis stages.
+
+Stages are timed with the timed decorator or the stage context manager,
+and events (rows parsed, cache hits, scipy calls) are tallied with count.
+Nothing is recorded until enable() is called, or the environment variable
+ABTEST_INSTRUMENT is set to 1; until then, each hook costs one flag check.
+
+    instrument.enable()
+    analysis.full_analysis()
+    print(instrument.to_prometheus())
+
+Collectors add values that are cheaper to read on demand than to count as
+they happen, like the hits and misses of the lru caches in analysis.py.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+PREFIX = "abtest"
+
+_enabled = os.environ.get("ABTEST_INSTRUMENT") == "1"
+_lock = threading.Lock()
+# name: [calls, total seconds, max seconds]
+_timers = OrderedDict()
+_counters = OrderedDict()
+_collectors = []
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """ Forget all timings and counts recorded so far. """
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def record(name, seconds):
+    """ Add one timed call of a stage. """
+    with _lock:
+        timer = _timers.setdefault(name, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+
+def count(name, amount=1):
+    """ Add amount to a counter, if instrumentation is enabled. """
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+
+class _NoStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """ Context manager that times its block as a call of stage name. """
+    return _Stage(name) if _enabled else _NO_STAGE
+
+
+def timed(name):
+    """ Decorator that times every call of a function as stage name. """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def register_collector(collector):
+    """ Add a function returning a dict of counters, read on snapshot. """
+    _collectors.append(collector)
+    return collector
+
+
+def snapshot():
+    """ All timers and counters so far, as a JSON-ready dict. """
+    with _lock:
+        timers = OrderedDict(
+            (
+                name,
+                {"calls": calls, "seconds": seconds, "max_seconds": longest},
+            )
+            for name, (calls, seconds, longest) in _timers.items()
+        )
+        counters = OrderedDict(_counters)
+    for collector in _collectors:
+        counters.update(collector())
+    return {"enabled": _enabled, "timers": timers, "counters": counters}
+
+
+def to_json(indent=2):
+    return json.dumps(snapshot(), indent=indent)
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "{}_{}".format(PREFIX, name))
+
+
+def to_prometheus():
+    """ The snapshot in the Prometheus text exposition format. """
+    data = snapshot()
+    lines = []
+    for suffix, kind, field in [
+        ("stage_calls_total", "counter", "calls"),
+        ("stage_seconds_total", "counter", "seconds"),
+        ("stage_max_seconds", "gauge", "max_seconds"),
+    ]:
+        if not data["timers"]:
+            continue
+        metric = _metric_name(suffix)
+        lines.append("# TYPE {} {}".format(metric, kind))
+        for name, timer in data["timers"].items():
+            lines.append(
+                '{}{{stage="{}"}} {}'.format(metric, name, timer[field])
+            )
+    for name, value in data["counters"].items():
+        metric = _metric_name(name + "_total")
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{} {}".format(metric, value))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,26 @@
+""" Deferred imports for the heavy dependencies of the analysis modules.
+
+    pd = lazy_import("pandas")
+
+binds a module object right away, but only imports pandas on the first
+attribute access, so a process that only sizes experiments never pays for
+pandas, and one that never runs a test never pays for scipy.stats.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """ Module that is imported on first attribute access. """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named {!r}".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
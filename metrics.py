@@ -0,0 +1,152 @@
+""" Registry of ratio metrics and the engine that evaluates them.
+
+A ratio metric, like gross conversion (Enrollments / Clicks), is declared
+once with its numerator and denominator columns and its minimum detectable
+difference. The engine evaluates all metrics together: the columns are
+gathered into arrays with one row per metric, and the pooled standard
+errors, confidence intervals and significance come from array operations.
+
+    register_metric("Payment rate", "Payments", "Enrollments", 0.01)
+"""
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import instrument
+from correction import correct_table
+from critical import critical_value
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+RatioMetric = namedtuple(
+    "RatioMetric", ["name", "numerator", "denominator", "d_min"]
+)
+
+REGISTRY = OrderedDict()
+
+
+def register_metric(name, numerator, denominator, d_min):
+    """ Add a ratio metric to the registry, replacing one of the same name.
+    """
+    metric = RatioMetric(name, numerator, denominator, d_min)
+    REGISTRY[name] = metric
+    return metric
+
+
+GROSS_CONVERSION = register_metric(
+    "Gross conversion", "Enrollments", "Clicks", 0.01
+)
+NET_CONVERSION = register_metric(
+    "Net conversion", "Payments", "Clicks", 0.0075
+)
+
+
+def registered(d_min=None):
+    """ Tuple of the registered metrics, with d_min overridden by name. """
+    d_min = d_min or {}
+    return tuple(
+        metric._replace(d_min=d_min.get(metric.name, metric.d_min))
+        for metric in REGISTRY.values()
+    )
+
+
+def _gather(values, columns, metrics):
+    """ Numerators and denominators of every metric, metrics first.
+
+    values has the columns along its last axis; the results have one row per
+    metric followed by the remaining axes of values.
+    """
+    columns = list(columns)
+    values = np.asarray(values, dtype=float)
+    numerators = [columns.index(metric.numerator) for metric in metrics]
+    denominators = [columns.index(metric.denominator) for metric in metrics]
+    return (
+        np.moveaxis(values[..., numerators], -1, 0),
+        np.moveaxis(values[..., denominators], -1, 0),
+    )
+
+
+def ratios(values, columns, metrics=None):
+    """ Value of every metric, with one row per metric. """
+    metrics = registered() if metrics is None else metrics
+    numerators, denominators = _gather(values, columns, metrics)
+    return numerators / denominators
+
+
+def evaluate(control, experiment, columns, alpha, metrics=None):
+    """ Pooled-SE confidence intervals of the experiment - control difference.
+
+    control and experiment hold totals with the given columns along their
+    last axis, and may have leading axes, e.g. one row per number of days.
+    Returns a dict of arrays with one row per metric.
+    """
+    metrics = registered() if metrics is None else metrics
+    cont_num, cont_den = _gather(control, columns, metrics)
+    exp_num, exp_den = _gather(experiment, columns, metrics)
+    d_min = np.array([metric.d_min for metric in metrics], dtype=float)
+    d_min = d_min.reshape((-1,) + (1,) * (cont_num.ndim - 1))
+    critical_two_tailed = critical_value(alpha)
+
+    pooled_probability = (cont_num + exp_num) / (cont_den + exp_den)
+    pooled_se = np.sqrt(
+        pooled_probability
+        * (1 - pooled_probability)
+        * (1 / cont_den + 1 / exp_den)
+    )
+    margin = critical_two_tailed * pooled_se
+    diff = exp_num / exp_den - cont_num / cont_den
+    # Two-sided z-test, below alpha exactly when S. is "yes"
+    instrument.count("scipy_calls")
+    p_value = 2 * stats.norm.sf(np.abs(diff) / pooled_se)
+
+    return {
+        "Control": cont_num / cont_den,
+        "Experiment": exp_num / exp_den,
+        "Difference": diff,
+        "Margin": margin,
+        "Lower bound": diff - margin,
+        "Upper bound": diff + margin,
+        "S.": margin < np.abs(diff),
+        "P.": d_min < np.minimum(np.abs(diff - margin), np.abs(diff + margin)),
+        "P-value": p_value,
+    }
+
+
+def confidence_intervals(
+    control, experiment, alpha, metrics=None, correction=None
+):
+    """ The confidence interval table of app.py, from two total Series.
+
+    The z-test p-values are in the P-value column. With a correction method
+    from correction.py, the metrics are corrected as one family.
+    """
+    metrics = registered() if metrics is None else metrics
+    result = evaluate(
+        control.values, experiment.values, control.index, alpha, metrics
+    )
+    table = pd.DataFrame(
+        {
+            column: result[column]
+            for column in ["Difference", "Lower bound", "Upper bound"]
+        },
+        index=[metric.name for metric in metrics],
+    )
+    for column in ["S.", "P."]:
+        table[column] = np.where(result[column], "yes", "no")
+    table["P-value"] = result["P-value"]
+    if correction is not None:
+        table = correct_table(table, alpha, correction)
+    return table
+
+
+def daily_differences(control, experiment, columns, metrics=None):
+    """ Experiment - control value of every metric on every day.
+
+    control and experiment are days x columns arrays; the result has one row
+    per metric and one column per day.
+    """
+    return ratios(experiment, columns, metrics) - ratios(
+        control, columns, metrics
+    )
@@ -0,0 +1,152 @@
+""" Monte Carlo power and duration planner for the free trial funnel.
+
+The sizing in app.py turns the closed-form sample size into an experiment
+duration, assuming the normal approximation and a constant number of
+pageviews per day. Here, experiments are simulated instead: for every
+candidate duration and traffic allocation, the pageviews of each group are
+drawn from a Poisson distribution, and the clicks, enrollments and payments
+follow as binomial draws at the baseline.csv rates, with the experiment group
+shifted by the minimum detectable effects. Every simulated experiment is
+evaluated with the registered metrics, and the share that comes out
+statistically significant is the empirical power.
+
+All simulations of a scenario are drawn as one array, and the scenarios are
+spread over a process pool, each with its own spawned seed.
+
+    python planner.py --days 14 18 21 28 --allocation 0.5 1.0
+"""
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import metrics
+from aggregator import COLUMNS
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def baseline_rates(baseline_values):
+    """ Funnel rates from the baseline.csv table. """
+    return {
+        "pageviews": baseline_values.loc[0, "Value"],
+        "click": baseline_values.loc[3, "Value"],
+        "enroll": baseline_values.loc[4, "Value"],
+        "pay": baseline_values.loc[5, "Value"],
+    }
+
+
+def shifted_rates(rates, d_min_gross_diff, d_min_net_diff):
+    """ Funnel rates with gross and net conversion moved by their d_min. """
+    gross = rates["enroll"] + d_min_gross_diff
+    net = rates["enroll"] * rates["pay"] + d_min_net_diff
+    return dict(rates, enroll=gross, pay=net / gross)
+
+
+def simulate_funnel(rng, pageviews, rates, simulations):
+    """ Simulated totals, simulations x COLUMNS, for an expected pageviews.
+    """
+    views = rng.poisson(pageviews, simulations)
+    clicks = rng.binomial(views, rates["click"])
+    enrollments = rng.binomial(clicks, rates["enroll"])
+    payments = rng.binomial(enrollments, rates["pay"])
+    return np.stack([views, clicks, enrollments, payments], axis=-1)
+
+
+def _scenario_power(scenario, rates, shifted, alpha, simulations, evaluated):
+    (days, allocation), seed = scenario
+    rng = np.random.default_rng(seed)
+    # The allocated traffic is split 50/50 between the two groups
+    pageviews = rates["pageviews"] * days * allocation / 2
+    control = simulate_funnel(rng, pageviews, rates, simulations)
+    experiment = simulate_funnel(rng, pageviews, shifted, simulations)
+    significant = metrics.evaluate(
+        control, experiment, COLUMNS, alpha, evaluated
+    )["S."]
+    return np.append(significant.mean(axis=1), significant.all(axis=0).mean())
+
+
+def simulate_power(
+    rates,
+    durations,
+    allocations=(1.0,),
+    alpha=0.05,
+    d_min_gross_diff=0.01,
+    d_min_net_diff=0.0075,
+    simulations=2000,
+    seed=0,
+    workers=1,
+):
+    """ Empirical power per metric for every duration and allocation.
+
+    Returns one row per (Days, Allocation), with the power of each metric and
+    of all metrics together. workers=None uses every core.
+    """
+    evaluated = metrics.registered(
+        {
+            metrics.GROSS_CONVERSION.name: d_min_gross_diff,
+            metrics.NET_CONVERSION.name: d_min_net_diff,
+        }
+    )
+    shifted = shifted_rates(rates, d_min_gross_diff, d_min_net_diff)
+    grid = list(itertools.product(durations, allocations))
+    scenarios = list(zip(grid, np.random.SeedSequence(seed).spawn(len(grid))))
+    run = partial(
+        _scenario_power,
+        rates=rates,
+        shifted=shifted,
+        alpha=alpha,
+        simulations=simulations,
+        evaluated=evaluated,
+    )
+
+    if workers is None or workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            powers = list(executor.map(run, scenarios))
+    else:
+        powers = [run(scenario) for scenario in scenarios]
+
+    return pd.DataFrame(
+        powers,
+        columns=[metric.name for metric in evaluated] + ["All metrics"],
+        index=pd.MultiIndex.from_tuples(grid, names=["Days", "Allocation"]),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--baseline", default="baseline.csv")
+    parser.add_argument("--days", type=int, nargs="+", required=True)
+    parser.add_argument("--allocation", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--d-min-gross", type=float, default=0.01)
+    parser.add_argument("--d-min-net", type=float, default=0.0075)
+    parser.add_argument("--simulations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    rates = baseline_rates(
+        pd.read_csv(args.baseline, names=["Metric", "Value"])
+    )
+    print(
+        simulate_power(
+            rates,
+            args.days,
+            args.allocation,
+            args.alpha,
+            args.d_min_gross,
+            args.d_min_net,
+            args.simulations,
+            args.seed,
+            args.workers,
+        ).to_csv(),
+        end="",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+""" Bootstrap confidence intervals and permutation tests for ratio metrics.
+
+The analytical intervals in metrics.py assume binomial counts. For
+heavy-tailed metrics the intervals here are built empirically instead, by
+resampling the units of each group: days for the daily CSVs, or single
+users for unit-level data. Every unit has a numerator and a denominator, and
+the statistic is the experiment - control difference in the ratio of their
+sums, so a per-user mean is a ratio with denominators of one.
+
+Resamples are drawn as batched index arrays, in chunks sized to a memory
+budget, from a SeedSequence spawned per chunk. The results only depend on
+the seed, not on the number of worker processes the chunks are spread over.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+
+# Resampled values held in memory at once, per chunk
+CHUNK_ELEMENTS = 2 ** 22
+
+
+def _clean(numerators, denominators):
+    """ Units as two float arrays, without units that miss either value. """
+    numerators = np.asarray(numerators, dtype=float)
+    denominators = np.asarray(denominators, dtype=float)
+    present = ~(np.isnan(numerators) | np.isnan(denominators))
+    return numerators[present], denominators[present]
+
+
+def _chunks(resamples, units, seed):
+    """ (size, seed) for every chunk of resamples. """
+    chunk_size = max(1, CHUNK_ELEMENTS // max(units, 1))
+    sizes = [chunk_size] * (resamples // chunk_size)
+    if resamples % chunk_size:
+        sizes.append(resamples % chunk_size)
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _ratios(numerators, denominators, picks):
+    """ Ratio of sums over the picked units, one per row of picks. """
+    return numerators[picks].sum(axis=1) / denominators[picks].sum(axis=1)
+
+
+def _bootstrap_chunk(chunk, control, experiment):
+    size, seed = chunk
+    rng = np.random.default_rng(seed)
+    statistics = []
+    for numerators, denominators in [experiment, control]:
+        picks = rng.integers(0, len(numerators), (size, len(numerators)))
+        statistics.append(_ratios(numerators, denominators, picks))
+    return statistics[0] - statistics[1]
+
+
+def _permutation_chunk(chunk, control, experiment):
+    size, seed = chunk
+    rng = np.random.default_rng(seed)
+    numerators = np.concatenate([control[0], experiment[0]])
+    denominators = np.concatenate([control[1], experiment[1]])
+    # Random keys sorted per row give one shuffle of the pooled units per row
+    order = np.argsort(rng.random((size, len(numerators))), axis=1)
+    split = len(control[0])
+    return _ratios(numerators, denominators, order[:, split:]) - _ratios(
+        numerators, denominators, order[:, :split]
+    )
+
+
+def _run(function, chunks, control, experiment, workers):
+    if workers is None or workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(
+                executor.map(
+                    function,
+                    chunks,
+                    [control] * len(chunks),
+                    [experiment] * len(chunks),
+                )
+            )
+    else:
+        parts = [function(chunk, control, experiment) for chunk in chunks]
+    return np.concatenate(parts)
+
+
+def bootstrap(
+    control_numerators,
+    control_denominators,
+    experiment_numerators,
+    experiment_denominators,
+    alpha=0.05,
+    resamples=10000,
+    seed=0,
+    workers=1,
+):
+    """ Percentile bootstrap interval of the difference in ratios.
+
+    Returns a dict with the observed difference, the interval bounds and the
+    bootstrap standard error. workers=None uses every core.
+    """
+    control = _clean(control_numerators, control_denominators)
+    experiment = _clean(experiment_numerators, experiment_denominators)
+    difference = (
+        experiment[0].sum() / experiment[1].sum()
+        - control[0].sum() / control[1].sum()
+    )
+
+    units = len(control[0]) + len(experiment[0])
+    differences = _run(
+        _bootstrap_chunk,
+        _chunks(resamples, units, seed),
+        control,
+        experiment,
+        workers,
+    )
+    lower, upper = np.percentile(
+        differences, [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    )
+    return {
+        "Difference": difference,
+        "Lower bound": lower,
+        "Upper bound": upper,
+        "Standard error": differences.std(ddof=1),
+    }
+
+
+def permutation_test(
+    control_numerators,
+    control_denominators,
+    experiment_numerators,
+    experiment_denominators,
+    resamples=10000,
+    seed=0,
+    workers=1,
+):
+    """ Two-sided permutation p-value of the difference in ratios. """
+    control = _clean(control_numerators, control_denominators)
+    experiment = _clean(experiment_numerators, experiment_denominators)
+    difference = (
+        experiment[0].sum() / experiment[1].sum()
+        - control[0].sum() / control[1].sum()
+    )
+
+    units = len(control[0]) + len(experiment[0])
+    differences = _run(
+        _permutation_chunk,
+        _chunks(resamples, units, seed),
+        control,
+        experiment,
+        workers,
+    )
+    extreme = np.count_nonzero(np.abs(differences) >= abs(difference))
+    return (extreme + 1) / (resamples + 1)
+
+
+def metric_intervals(
+    control,
+    experiment,
+    columns,
+    alpha=0.05,
+    resamples=10000,
+    seed=0,
+    workers=1,
+    evaluated=None,
+):
+    """ Day-level bootstrap interval and permutation p-value per metric.
+
+    control and experiment are days x columns arrays of daily counts, and
+    evaluated the ratio metrics to test (all registered ones by default).
+    """
+    evaluated = metrics.registered() if evaluated is None else evaluated
+    columns = list(columns)
+    rows = []
+    for metric in evaluated:
+        groups = [
+            data[:, columns.index(column)]
+            for data in [control, experiment]
+            for column in [metric.numerator, metric.denominator]
+        ]
+        result = bootstrap(
+            *groups,
+            alpha=alpha,
+            resamples=resamples,
+            seed=seed,
+            workers=workers
+        )
+        p_value = permutation_test(
+            *groups, resamples=resamples, seed=seed, workers=workers
+        )
+        result["P-value"] = p_value
+        result["Significant"] = "yes" if p_value < alpha else "no"
+        rows.append(result)
+    return pd.DataFrame(rows, index=[metric.name for metric in evaluated])
@@ -1,16 +1,24 @@
 from math import ceil
 import numpy as np
-from scipy.stats import norm
+
+import instrument
+from critical import critical_value, quantile
 
 """ Credits to Evan Miller, all I did was reimplement this in Python. """
 
 
-def sample_size(alpha, power, baseline, delta):
+@instrument.timed("sample_size")
+def sample_size(alpha, power, baseline, delta, arms=2):
+    """ Sample size per arm. With more than two arms, alpha is split over
+    the arms - 1 comparisons against control (Bonferroni).
+    """
+    if arms < 2:
+        raise ValueError("an experiment needs at least two arms")
     if baseline > 0.5:
         baseline = 1.0 - baseline
 
-    t_alpha2 = norm.ppf(1.0 - alpha / 2)
-    t_beta = norm.ppf(power)
+    t_alpha2 = critical_value(alpha, tests=arms - 1, correction="bonferroni")
+    t_beta = quantile(power)
 
     sd1 = np.sqrt(2 * baseline * (1 - baseline))
     sd2 = np.sqrt(
@@ -18,3 +26,38 @@ def sample_size(alpha, power, baseline, delta):
     )
 
     return ceil((t_alpha2 * sd1 + t_beta * sd2) ** 2 / delta ** 2)
+
+
+@instrument.timed("batch_sample_size")
+def batch_sample_size(alpha, power, baseline, delta, arms=2):
+    """ Same as sample_size, but every argument can be an array.
+
+    The arguments are broadcast against each other, so a grid of scenarios
+    can be sized in one pass, e.g. deltas of shape (n, 1) against powers of
+    shape (1, m) return an (n, m) array of sizes.
+    """
+    alpha, power, baseline, delta, arms = np.broadcast_arrays(
+        np.asarray(alpha, dtype=float),
+        np.asarray(power, dtype=float),
+        np.asarray(baseline, dtype=float),
+        np.asarray(delta, dtype=float),
+        np.asarray(arms),
+    )
+    if np.any(arms < 2):
+        raise ValueError("an experiment needs at least two arms")
+    baseline = np.where(baseline > 0.5, 1.0 - baseline, baseline)
+
+    t_alpha2 = critical_value(alpha, tests=arms - 1, correction="bonferroni")
+    t_beta = quantile(power)
+
+    sd1 = np.sqrt(2 * baseline * (1 - baseline))
+    sd2 = np.sqrt(
+        baseline * (1 - baseline) + (baseline + delta) * (1 - baseline - delta)
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sizes = np.ceil((t_alpha2 * sd1 + t_beta * sd2) ** 2 / delta ** 2)
+    # The scalar version raises on these, instead of a cast to INT64_MIN
+    if not np.all(np.isfinite(sizes)):
+        raise ValueError("no finite sample size for some of the inputs")
+    return sizes.astype(np.int64)
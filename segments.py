@@ -0,0 +1,126 @@
+""" The analysis from app.py per segment, for CSVs with dimension columns.
+
+Daily exports may carry dimension columns (platform, country, course, ...)
+next to Date and the counts. Instead of filtering the data and rerunning the
+analysis for every segment, both groups are aggregated in one groupby over
+the dimensions, and the sanity checks, confidence intervals and sign tests
+are evaluated for all segments at once on the resulting arrays. Memory
+grows linearly with the number of segments (times days for the sign tests).
+"""
+import numpy as np
+
+import metrics
+from aggregator import COLUMNS
+from critical import critical_value
+from lazyimport import lazy_import
+from signtest import sign_test
+
+pd = lazy_import("pandas")
+
+INVARIANTS = [("Cookies", "Pageviews"), ("Clicks", "Clicks")]
+
+
+def _first_days(data, number_of_days):
+    """ Rows of the first number_of_days distinct dates, in file order. """
+    if number_of_days is None:
+        return data
+    dates = data["Date"].drop_duplicates()[:number_of_days]
+    return data[data["Date"].isin(dates)]
+
+
+def segmented_analysis(
+    control,
+    experiment,
+    dimensions,
+    alpha=0.05,
+    number_of_days=None,
+    evaluated=None,
+):
+    """ Sanity checks, confidence intervals and sign tests per segment.
+
+    control and experiment are DataFrames shaped like control.csv plus the
+    given dimension columns, and evaluated the ratio metrics to test (all
+    registered ones by default). Returns one row per segment, indexed by
+    the dimensions.
+    """
+    evaluated = metrics.registered() if evaluated is None else evaluated
+    dimensions = list(dimensions)
+    data = pd.concat(
+        [
+            _first_days(control, number_of_days).assign(Group="Control"),
+            _first_days(experiment, number_of_days).assign(Group="Experiment"),
+        ],
+        ignore_index=True,
+    )
+
+    # One grouped aggregation for every segment and day of both groups
+    daily = data.groupby(dimensions + ["Date", "Group"], sort=False)[
+        COLUMNS
+    ].sum(min_count=1)
+    totals = daily.groupby(level=dimensions + ["Group"]).sum()
+    segments = totals.index.droplevel("Group").unique()
+    cont = totals.xs("Control", level="Group").reindex(segments).values
+    exp = totals.xs("Experiment", level="Group").reindex(segments).values
+
+    table = {}
+
+    # Sanity checks
+    critical_two_tailed = critical_value(alpha)
+    for invariant, column in INVARIANTS:
+        index = COLUMNS.index(column)
+        total = cont[:, index] + exp[:, index]
+        control_proportion = cont[:, index] / total
+        margin = critical_two_tailed * np.sqrt(0.5 ** 2 / total)
+        table[invariant + " lower bound"] = 0.5 - margin
+        table[invariant + " upper bound"] = 0.5 + margin
+        table[invariant + " observed"] = control_proportion
+        table[invariant + " passes"] = np.where(
+            (control_proportion > 0.5 - margin)
+            & (control_proportion < 0.5 + margin),
+            "yes",
+            "no",
+        )
+
+    # Confidence intervals, metrics x segments
+    intervals = metrics.evaluate(cont, exp, COLUMNS, alpha, evaluated)
+
+    # Sign tests: days as a third axis, segments x days x columns
+    days = daily.index.get_level_values("Date").unique()
+    shape = (len(segments), len(days), len(COLUMNS))
+    grid = pd.MultiIndex.from_tuples(
+        [
+            (segment if isinstance(segment, tuple) else (segment,)) + (day,)
+            for segment in segments
+            for day in days
+        ],
+        names=dimensions + ["Date"],
+    )
+    cube = {
+        group: daily.xs(group, level="Group")
+        .reindex(grid)
+        .values.reshape(shape)
+        for group in ["Control", "Experiment"]
+    }
+    differences = metrics.daily_differences(
+        cube["Control"], cube["Experiment"], COLUMNS, evaluated
+    )
+    signs = sign_test(differences.reshape(-1, len(days)), alpha)
+    sign_p_values = signs["P-value"].values.reshape(
+        len(evaluated), len(segments)
+    )
+
+    for row, metric in enumerate(evaluated):
+        for column, label in [
+            ("Difference", " difference"),
+            ("Lower bound", " lower bound"),
+            ("Upper bound", " upper bound"),
+            ("P-value", " p-value"),
+        ]:
+            table[metric.name + label] = intervals[column][row]
+        for column in ["S.", "P."]:
+            table[metric.name + " " + column] = np.where(
+                intervals[column][row], "yes", "no"
+            )
+        table[metric.name + " sign test p-value"] = sign_p_values[row]
+
+    return pd.DataFrame(table, index=segments)
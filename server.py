@@ -0,0 +1,366 @@
+""" JSON API for the sizing and the full analysis, on plain asyncio.
+
+    POST /sample-size  {"baseline": [0.20625], "delta": [0.01, 0.02]}
+    POST /analysis     {"control": "control.csv", "days": 23}
+    GET  /health
+
+Sizing takes alpha, power, baseline, delta (numbers or lists) and arms.
+The analysis takes the parameters of analysis.full_analysis (days, alpha,
+beta, d_min_gross, d_min_net) and its three inputs: baseline, control and
+experiment, each either a file name relative to the data directory or the
+data inline, as [metric, value] pairs for baseline and as a list of row
+objects like {"Date": "Sat, Oct 11", "Pageviews": 7723, ...} for the
+groups. Inline data is written to a file named by its hash, so repeated
+requests hit the same caches as files do.
+
+Probabilities and differences (alpha, power, beta, baseline, the d_min
+values) must be between 0 and 1, delta below 1 - baseline, days a positive
+integer and arms at least 2; anything else is answered with a 400.
+
+Requests run in a process pool, so the event loop only parses and answers
+requests. Identical requests that arrive while one is being computed wait
+for that one's result instead of computing it again. Set ABTEST_STORE to
+share results across restarts and replicas (see store.py).
+
+    python server.py --port 8000 --data-dir .
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import analysis
+from aggregator import COLUMNS
+from cli import size_rows, to_json
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+
+MAX_BODY_BYTES = 16 * 2 ** 20
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+SIZE_PARAMETERS = {
+    "alpha": float,
+    "power": float,
+    "baseline": float,
+    "delta": float,
+    "arms": int,
+}
+ANALYSIS_PARAMETERS = {
+    "days": int,
+    "alpha": float,
+    "beta": float,
+    "d_min_gross": float,
+    "d_min_net": float,
+}
+# The sizing takes a grid of these; every other parameter is one number
+LIST_PARAMETERS = ("baseline", "delta")
+# Probabilities and differences of conversion rates
+FRACTIONS = ("alpha", "power", "beta", "baseline", "d_min_gross", "d_min_net")
+INPUTS = {
+    "baseline": analysis.BASELINE_PATH,
+    "control": analysis.CONTROL_PATH,
+    "experiment": analysis.EXPERIMENT_PATH,
+}
+
+
+class RequestError(Exception):
+    """ A request the service can't answer, with its HTTP status. """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _number(name, value, kind):
+    # JSON booleans are ints to Python, and strings aren't numbers
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RequestError("invalid {}: {!r}".format(name, value))
+    if not math.isfinite(value):
+        raise RequestError("{} must be finite".format(name))
+    if kind is int and value != int(value):
+        raise RequestError("{} must be an integer".format(name))
+    return kind(value)
+
+
+def _parameters(request, types, inputs=()):
+    unknown = set(request) - set(types) - set(inputs)
+    if unknown:
+        raise RequestError("unknown fields: " + ", ".join(sorted(unknown)))
+    parameters = {}
+    for name, kind in types.items():
+        value = request.get(name)
+        if value is None:
+            continue
+        listed = isinstance(value, list)
+        if listed and name not in LIST_PARAMETERS:
+            raise RequestError("{} must be a number".format(name))
+        values = [
+            _number(name, item, kind)
+            for item in (value if listed else [value])
+        ]
+        if not values:
+            raise RequestError("{} must not be empty".format(name))
+        if name == "arms":
+            if values[0] < 2:
+                raise RequestError("arms must be at least 2")
+        elif name in FRACTIONS:
+            if not all(0 < item < 1 for item in values):
+                raise RequestError("{} must be between 0 and 1".format(name))
+        elif not all(item > 0 for item in values):
+            raise RequestError("{} must be positive".format(name))
+        parameters[name] = values if listed else values[0]
+    return parameters
+
+
+def _size_parameters(request):
+    parameters = _parameters(request, SIZE_PARAMETERS)
+    for name in LIST_PARAMETERS:
+        if name not in parameters:
+            raise RequestError("baseline and delta are required")
+        if not isinstance(parameters[name], list):
+            parameters[name] = [parameters[name]]
+    # Like sample_size, measured from the nearer of 0 and 1
+    for baseline in parameters["baseline"]:
+        if max(parameters["delta"]) >= 1 - min(baseline, 1 - baseline):
+            raise RequestError(
+                "delta must be below {:g} for baseline {:g}".format(
+                    1 - min(baseline, 1 - baseline), baseline
+                )
+            )
+    return parameters
+
+
+def compute_sample_sizes(parameters):
+    return size_rows(
+        parameters.get("alpha", 0.05),
+        parameters.get("power", 0.8),
+        parameters["baseline"],
+        parameters["delta"],
+        parameters.get("arms", 2),
+    )
+
+
+def compute_analysis(parameters, paths):
+    return to_json(
+        analysis.full_analysis(
+            number_of_days=parameters.get("days"),
+            alpha=parameters.get("alpha", 0.05),
+            beta=parameters.get("beta", 0.2),
+            d_min_gross_diff=parameters.get("d_min_gross", 0.01),
+            d_min_net_diff=parameters.get("d_min_net", 0.0075),
+            baseline_path=paths["baseline"],
+            control_path=paths["control"],
+            experiment_path=paths["experiment"],
+        )
+    )
+
+
+class AnalysisService:
+    """ The HTTP service; start() it inside a running event loop. """
+
+    def __init__(self, data_dir=".", workers=None):
+        self.data_dir = os.path.realpath(data_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.inline_dir = tempfile.mkdtemp(prefix="abtest-inline-")
+        self.pending = {}
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8000):
+        # Fork the workers now: forked on the first request, they would
+        # inherit the listening and client sockets, and hold them open
+        loop = asyncio.get_event_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self.executor, os.getpid)
+                for _ in range(self.workers)
+            )
+        )
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown()
+        shutil.rmtree(self.inline_dir, ignore_errors=True)
+
+    def _input_path(self, name, value):
+        """ Path of a file reference or of inline data saved to a file. """
+        if isinstance(value, str):
+            path = os.path.realpath(os.path.join(self.data_dir, value))
+            if not path.startswith(self.data_dir + os.sep):
+                raise RequestError(
+                    "{} is outside the data directory".format(value)
+                )
+            if not os.path.isfile(path):
+                raise RequestError("{} not found".format(value), 404)
+            return path
+
+        if not isinstance(value, list) or not value:
+            raise RequestError("{} must be a file name or rows".format(name))
+        try:
+            rows = pd.DataFrame(value)
+        except ValueError as error:
+            raise RequestError("invalid {} rows: {}".format(name, error))
+        if name == "baseline":
+            if rows.shape[1] != 2:
+                raise RequestError("baseline rows must be [metric, value]")
+            text = rows.to_csv(index=False, header=False)
+        else:
+            missing = [
+                column
+                for column in ["Date"] + COLUMNS
+                if column not in rows.columns
+            ]
+            if missing:
+                raise RequestError(
+                    "{} rows need {}".format(name, ", ".join(missing))
+                )
+            text = rows.to_csv(index=False)
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        path = os.path.join(self.inline_dir, digest + ".csv")
+        if not os.path.exists(path):
+            temporary = "{}.{}.tmp".format(path, os.getpid())
+            with open(temporary, "w") as data:
+                data.write(text)
+            os.replace(temporary, path)
+        return path
+
+    def _job(self, route, request):
+        """ (key, function, arguments) of the work a request asks for. """
+        if route == "/sample-size":
+            parameters = _size_parameters(request)
+            arguments = (parameters,)
+            function = compute_sample_sizes
+        else:
+            parameters = _parameters(request, ANALYSIS_PARAMETERS, INPUTS)
+            paths = {
+                name: self._input_path(name, request.get(name, default))
+                for name, default in INPUTS.items()
+            }
+            arguments = (parameters, paths)
+            function = compute_analysis
+        key = route + json.dumps(arguments, sort_keys=True)
+        return key, function, arguments
+
+    async def respond(self, method, route, body):
+        """ (status, payload) for a request. """
+        if route == "/health":
+            return 200, {"status": "ok"}
+        if route not in ("/sample-size", "/analysis"):
+            raise RequestError("no such endpoint: " + route, 404)
+        if method != "POST":
+            raise RequestError("use POST", 405)
+        try:
+            request = json.loads(body.decode("utf-8") or "{}")
+        except ValueError as error:
+            raise RequestError("invalid JSON: {}".format(error))
+        if not isinstance(request, dict):
+            raise RequestError("the body must be a JSON object")
+
+        key, function, arguments = self._job(route, request)
+        # Identical requests share one computation while it runs
+        future = self.pending.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.run_in_executor(self.executor, function, *arguments)
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        try:
+            return 200, await asyncio.shield(future)
+        except ValueError as error:
+            # The analysis raises ValueError for inputs it can't use, like
+            # a count column that isn't numeric
+            raise RequestError("{}: {}".format(type(error).__name__, error))
+
+    async def _read_request(self, reader):
+        """ (method, path, body) of the HTTP request on a connection. """
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_BYTES:
+                raise RequestError("body too large", 413)
+            body = await reader.readexactly(length) if length else b""
+        except (ValueError, asyncio.IncompleteReadError):
+            raise RequestError("malformed request")
+        return method, target.split("?", 1)[0], body
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                status, payload = await self.respond(
+                    *await self._read_request(reader)
+                )
+            except RequestError as error:
+                status, payload = error.status, {"error": str(error)}
+            except Exception as error:
+                status, payload = (
+                    500,
+                    {"error": "{}: {}".format(type(error).__name__, error)},
+                )
+
+            content = json.dumps(payload).encode()
+            writer.write(
+                "HTTP/1.1 {} {}\r\n"
+                "Content-Type: application/json\r\n"
+                "Content-Length: {}\r\n"
+                "Connection: close\r\n\r\n".format(
+                    status, REASONS[status], len(content)
+                ).encode("latin-1")
+                + content
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--data-dir", default=".", help="directory of the referenced files"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    loop = asyncio.get_event_loop()
+    service = AnalysisService(args.data_dir, args.workers)
+    loop.run_until_complete(service.start(args.host, args.port))
+    print("Serving on http://{}:{}".format(args.host, args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(service.close())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+""" Batched sign tests on daily differences.
+
+Each row of a 2-D array of daily differences (metrics x days, or experiments
+x days) is tested at once: the positive, negative, tied and missing days are
+counted with array operations, and the exact two-sided binomial p-values for
+all rows come from a single vectorized cdf call.
+
+Missing days (NaN, e.g. enrollments after Nov 2) are left out of the test.
+Ties (a difference of exactly zero) carry no sign, so by default they are
+left out as well; with ties="negative" they count as not positive instead.
+"""
+import numpy as np
+
+import instrument
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+TIES = ("drop", "negative")
+
+
+def two_sided_p_values(successes, trials):
+    """ Exact two-sided binomial p-values for p = 0.5, like stats.binom_test.
+
+    Works element-wise on arrays; zero trials give a p-value of 1.
+    """
+    successes = np.asarray(successes)
+    trials = np.asarray(trials)
+    instrument.count("scipy_calls")
+    # The distribution is symmetric, so the two tails are equally likely
+    tail = stats.binom.cdf(
+        np.minimum(successes, trials - successes), trials, 0.5
+    )
+    return np.where(trials > 0, np.minimum(1.0, 2 * tail), 1.0)
+
+
+def sign_counts(differences, ties="drop"):
+    """ Positive days and days tested per row, as two integer arrays. """
+    if ties not in TIES:
+        raise ValueError("ties must be one of {}".format(", ".join(TIES)))
+    differences = np.atleast_2d(np.asarray(differences, dtype=float))
+    present = ~np.isnan(differences)
+    positives = np.count_nonzero(differences > 0, axis=1)
+    if ties == "drop":
+        trials = np.count_nonzero(present & (differences != 0), axis=1)
+    else:
+        trials = np.count_nonzero(present, axis=1)
+    return positives, trials
+
+
+def sign_test(differences, alpha=0.05, ties="drop", index=None):
+    """ Sign test for every row of differences, as a DataFrame.
+
+    differences is a 2-D array or DataFrame with one row per metric (or
+    experiment) and one column per day. The rows of the result keep the
+    DataFrame's index, or the given index.
+    """
+    if index is None and isinstance(differences, pd.DataFrame):
+        index = differences.index
+    values = np.atleast_2d(np.asarray(differences, dtype=float))
+    present = ~np.isnan(values)
+
+    positives, trials = sign_counts(values, ties)
+    p_values = two_sided_p_values(positives, trials)
+
+    return pd.DataFrame(
+        {
+            "Positive": positives,
+            "Negative": np.count_nonzero(values < 0, axis=1),
+            "Ties": np.count_nonzero(present & (values == 0), axis=1),
+            "Missing": np.count_nonzero(~present, axis=1),
+            "N": trials,
+            "P-value": p_values,
+            "Significant": np.where(p_values < alpha, "yes", "no"),
+        },
+        index=index,
+    )
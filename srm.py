@@ -0,0 +1,104 @@
+""" Sample ratio mismatch checks for any split and any number of arms.
+
+The sanity checks in app.py test whether an invariant, like cookies, was
+split 50/50 between two groups. Here, the observed counts of every arm are
+compared against an arbitrary expected split, e.g. (0.9, 0.1) for a ramped
+rollout or (1, 1, 1) for an A/B/C test, with two tests:
+
+- a chi-square goodness-of-fit test over all arms at once, and
+- an exact binomial test of each arm against the rest, Bonferroni corrected
+  over the arms when there are more than two.
+
+Counts are arrays with the arms along the last axis, so every invariant of
+every experiment is checked in one call.
+
+    srm_matrix(counts, expected=(0.9, 0.1), invariants=["Cookies", "Clicks"])
+"""
+import numpy as np
+
+import instrument
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+TESTS = ("Chi-square", "Binomial")
+
+
+def expected_shares(expected, arms):
+    """ The expected split as shares summing to one, equal by default. """
+    if expected is None:
+        return np.full(arms, 1 / arms)
+    expected = np.asarray(expected, dtype=float)
+    if expected.shape[-1] != arms:
+        raise ValueError(
+            "expected has {} shares for {} arms".format(
+                expected.shape[-1], arms
+            )
+        )
+    return expected / expected.sum(axis=-1, keepdims=True)
+
+
+def srm_test(counts, expected=None):
+    """ Chi-square and binomial p-values of the observed split.
+
+    counts has the arms along its last axis, and expected the share (or any
+    weight) of each arm, broadcast against counts. Returns a dict of arrays
+    shaped like counts without the arm axis, except for the shares.
+    """
+    counts = np.asarray(counts, dtype=float)
+    arms = counts.shape[-1]
+    shares = expected_shares(expected, arms)
+    total = counts.sum(axis=-1, keepdims=True)
+    expected_counts = total * shares
+
+    chi_square = ((counts - expected_counts) ** 2 / expected_counts).sum(
+        axis=-1
+    )
+
+    # Every arm against the others, twice the smaller tail
+    instrument.count("scipy_calls", 3)
+    lower = stats.binom.cdf(counts, total, shares)
+    upper = stats.binom.sf(counts - 1, total, shares)
+    arm_p_values = np.minimum(2 * np.minimum(lower, upper), 1.0)
+    # With two arms, both give the same p-value, so there is one test
+    tests = arms if arms > 2 else 1
+    binomial_p_value = np.minimum(arm_p_values.min(axis=-1) * tests, 1.0)
+
+    return {
+        "Observed share": counts / total,
+        "Expected share": np.broadcast_to(shares, counts.shape),
+        "Chi-square": chi_square,
+        "Chi-square p-value": stats.chi2.sf(chi_square, arms - 1),
+        "Binomial p-value": binomial_p_value,
+    }
+
+
+def srm_matrix(
+    counts, alpha=0.05, expected=None, experiments=None, invariants=None
+):
+    """ Pass/fail of both tests for every experiment and invariant.
+
+    counts is experiments x invariants x arms, or invariants x arms for a
+    single experiment. A check passes ("yes") unless its p-value is below
+    alpha; missing counts fail. Returns one row per experiment, with an
+    (invariant, test) column per check.
+    """
+    counts = np.asarray(counts, dtype=float)
+    if counts.ndim == 2:
+        counts = counts[np.newaxis]
+    number_of_experiments, number_of_invariants, _ = counts.shape
+    if experiments is None:
+        experiments = range(number_of_experiments)
+    if invariants is None:
+        invariants = range(number_of_invariants)
+
+    result = srm_test(counts, expected)
+    p_values = np.stack(
+        [result["Chi-square p-value"], result["Binomial p-value"]], axis=-1
+    ).reshape(number_of_experiments, -1)
+    return pd.DataFrame(
+        np.where(p_values >= alpha, "yes", "no"),
+        index=list(experiments),
+        columns=pd.MultiIndex.from_product([list(invariants), TESTS]),
+    )
@@ -0,0 +1,190 @@
+""" Persistent store for analysis results, shared across processes.
+
+Results are keyed by a hash of RESULTS_VERSION, the numpy and pandas
+versions, the contents of their input files and their parameters, so an
+unchanged analysis is read back instead of recomputed, after a restart or
+from another replica sharing the file. The store is one SQLite database in
+WAL mode, which lets several processes read while one writes. Values are
+pickled, and the least recently used ones are evicted once the store grows
+past its size limit; a value that can't be unpickled counts as missing.
+
+The store is off until the environment variable ABTEST_STORE is set to the
+path of its file, e.g. results.sqlite, which app.py uses by default.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+import instrument
+from lazyimport import lazy_import
+
+pd = lazy_import("pandas")
+
+# Part of every key: bump it whenever the calculation or the shape of a
+# stored result changes, so results of older code are never returned
+RESULTS_VERSION = 1
+
+DEFAULT_PATH = "results.sqlite"
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+@lru_cache(maxsize=1024)
+def _file_hash(stamp):
+    digest = hashlib.sha256()
+    with open(stamp[0], "rb") as data:
+        for block in iter(lambda: data.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path):
+    """ SHA-256 of a file's contents, hashed once per modification. """
+    stat = os.stat(path)
+    return _file_hash((path, stat.st_mtime_ns, stat.st_size))
+
+
+def result_key(name, paths, parameters):
+    """ Key of a result from its name, input files and parameters. """
+    # Pickles of one pandas or numpy version may not load in another
+    digest = hashlib.sha256(
+        "{}:{}:{}:{}".format(
+            RESULTS_VERSION, np.__version__, pd.__version__, name
+        ).encode()
+    )
+    for path in paths:
+        digest.update(fingerprint(path).encode())
+    digest.update(repr(tuple(parameters)).encode())
+    return digest.hexdigest()
+
+
+class ResultStore:
+    """ Pickled results in a SQLite file, with a least recently used limit.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self):
+        # SQLite connections must not cross threads or forks
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        """ The stored result for key, or None. """
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            value = pickle.loads(row[0])
+        except (pickle.UnpicklingError, AttributeError, ImportError, EOFError):
+            # Corrupt, or from code that no longer exists: drop it
+            connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        connection.execute(
+            "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+        )
+        return value
+
+    def put(self, key, value):
+        """ Store a result, evicting the least recently used if needed. """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        connection = self._connection()
+        # IMMEDIATE takes the write lock up front, so concurrent writers
+        # queue instead of failing halfway through the eviction
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            (total,) = connection.execute(
+                "SELECT SUM(size) FROM results"
+            ).fetchone()
+            if total > self.max_bytes:
+                evicted = []
+                for old_key, size in connection.execute(
+                    "SELECT key, size FROM results ORDER BY accessed"
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_key,))
+                    total -= size
+                connection.executemany(
+                    "DELETE FROM results WHERE key = ?", evicted
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self._connection().execute("DELETE FROM results")
+
+    def fetch(self, name, paths, parameters, compute):
+        """ The stored result, or compute() stored under its key.
+
+        A store that can't be opened or written (e.g. a read-only
+        directory) is skipped, and the result computed every time.
+        """
+        try:
+            key = result_key(name, paths, parameters)
+            value = self.get(key)
+        except sqlite3.Error:
+            return compute()
+        if value is not None:
+            instrument.count("store_hits")
+            return value
+
+        instrument.count("store_misses")
+        value = compute()
+        try:
+            self.put(key, value)
+        except sqlite3.Error:
+            pass
+        return value
+
+
+_default = None
+
+
+def default_store():
+    """ The store at ABTEST_STORE, or None when it isn't set. """
+    global _default
+    path = os.environ.get("ABTEST_STORE")
+    if not path:
+        return None
+    if _default is None or _default.path != path:
+        _default = ResultStore(path)
+    return _default
@@ -0,0 +1,85 @@
+""" The analysis from app.py for every experiment length at once.
+
+Instead of rerunning the analysis for 1, 2, ..., N days, the totals for all
+day counts come from the cumulative sums of the daily data, and every
+statistic is computed on those arrays in one pass.
+"""
+import numpy as np
+
+import metrics
+from critical import critical_value
+from lazyimport import lazy_import
+from signtest import two_sided_p_values
+
+pd = lazy_import("pandas")
+
+
+def _yes_no(flags):
+    return np.where(flags, "yes", "no")
+
+
+def significance_timeline(control, experiment, alpha, evaluated=None):
+    """ Sanity checks, confidence intervals and sign tests per day count.
+
+    control and experiment are DailyAggregators, and evaluated the ratio
+    metrics to test (all registered ones by default). Row N of the result
+    holds what app.py shows with the slider on N days.
+    """
+    evaluated = metrics.registered() if evaluated is None else evaluated
+    number_of_days = min(len(control), len(experiment))
+    days = np.arange(1, number_of_days + 1)
+    columns = control.columns
+    cont = dict(zip(columns, control.cumulative(number_of_days).T))
+    exp = dict(zip(columns, experiment.cumulative(number_of_days).T))
+    critical_two_tailed = critical_value(alpha)
+
+    timeline = {}
+
+    # Sanity checks
+    for invariant, column in [("Cookies", "Pageviews"), ("Clicks", "Clicks")]:
+        total = cont[column] + exp[column]
+        control_proportion = cont[column] / total
+        margin = critical_two_tailed * np.sqrt(0.5 ** 2 / total)
+        timeline[invariant + " lower bound"] = 0.5 - margin
+        timeline[invariant + " upper bound"] = 0.5 + margin
+        timeline[invariant + " observed"] = control_proportion
+        timeline[invariant + " passes"] = _yes_no(
+            (control_proportion > 0.5 - margin)
+            & (control_proportion < 0.5 + margin)
+        )
+
+    # Confidence intervals and sign tests, all metrics at once
+    intervals = metrics.evaluate(
+        control.cumulative(number_of_days),
+        experiment.cumulative(number_of_days),
+        columns,
+        alpha,
+        evaluated,
+    )
+    daily_diff = metrics.daily_differences(
+        control.values(number_of_days),
+        experiment.values(number_of_days),
+        columns,
+        evaluated,
+    )
+    # Missing and tied days are left out, like in signtest.sign_test
+    positives = np.cumsum(daily_diff > 0, axis=1)
+    trials = np.cumsum(~np.isnan(daily_diff) & (daily_diff != 0), axis=1)
+    p_values = two_sided_p_values(positives, trials)
+
+    for row, metric in enumerate(evaluated):
+        for column, label in [
+            ("Difference", " difference"),
+            ("Margin", " margin"),
+            ("Lower bound", " lower bound"),
+            ("Upper bound", " upper bound"),
+        ]:
+            timeline[metric.name + label] = intervals[column][row]
+        timeline[metric.name + " S."] = _yes_no(intervals["S."][row])
+        timeline[metric.name + " P."] = _yes_no(intervals["P."][row])
+        timeline[metric.name + " sign test p-value"] = p_values[row]
+        timeline[metric.name + " sign test significant"] = _yes_no(
+            p_values[row] < alpha
+        )
+
+    return pd.DataFrame(timeline, index=pd.Index(days, name="Days"))
@@ -0,0 +1,211 @@
+""" Live analysis of daily CSVs that grow by one row per day.
+
+CsvTail remembers how far into a file it has read, so each refresh only
+parses the lines appended since. LiveAnalysis folds the new days into a
+DailyAggregator per group and keeps running sign test counts, so the
+updated tables never require reading or reprocessing the earlier days. A
+last line without its newline, like the last day of the CSVs in this repo,
+is counted in the tables but only folded in once its newline arrives, as
+it may still be being written.
+
+    live = LiveAnalysis("control.csv", "experiment.csv")
+    while True:
+        if live.refresh():
+            print(live.tables()["confidence_intervals"])
+        time.sleep(60)
+"""
+import csv
+import io
+import os
+import threading
+
+import numpy as np
+
+import analysis
+import metrics
+from aggregator import COLUMNS, DailyAggregator
+from lazyimport import lazy_import
+from signtest import two_sided_p_values
+
+pd = lazy_import("pandas")
+
+
+class CsvTail:
+    """ Reader for the rows appended to a CSV since the previous read. """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.header = None
+        self.pending = None
+
+    def read(self):
+        """ New complete rows, as lists of strings.
+
+        Only lines that end in a newline are taken. A last line without one
+        is parsed into pending, and read again once its newline arrives. If
+        the file shrank, it was rewritten, and ValueError is raised.
+        """
+        with open(self.path, "rb") as data:
+            data.seek(0, os.SEEK_END)
+            size = data.tell()
+            if size < self.offset:
+                raise ValueError("{} was truncated".format(self.path))
+            data.seek(self.offset)
+            chunk = data.read(size - self.offset)
+
+        end = chunk.rfind(b"\n") + 1
+        self.offset += end
+        rows = _parse(chunk[:end])
+        if self.header is None and rows:
+            self.header = rows.pop(0)
+        # A partial row may be cut off mid-field, but never has extra fields
+        pending = _parse(chunk[end:]) if self.header is not None else []
+        self.pending = pending[0] if pending else None
+        if self.pending is not None and len(self.pending) != len(self.header):
+            self.pending = None
+        return rows
+
+
+def _parse(text):
+    return [
+        row for row in csv.reader(io.StringIO(text.decode("utf-8"))) if row
+    ]
+
+
+def _count(value):
+    return float(value) if value != "" else np.nan
+
+
+def _counts(header, row):
+    return [_count(row[header.index(column)]) for column in COLUMNS]
+
+
+class LiveAnalysis:
+    """ Running analysis of a control and an experiment CSV.
+
+    Days are paired by position, so a day counts once both files have it.
+    One instance can be shared between threads, e.g. Streamlit sessions.
+    """
+
+    def __init__(
+        self,
+        control_path=analysis.CONTROL_PATH,
+        experiment_path=analysis.EXPERIMENT_PATH,
+        alpha=0.05,
+        d_min_gross_diff=0.01,
+        d_min_net_diff=0.0075,
+    ):
+        self.alpha = alpha
+        self.evaluated = analysis.conversion_metrics(
+            d_min_gross_diff, d_min_net_diff
+        )
+        self.paths = [control_path, experiment_path]
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.tails = [CsvTail(path) for path in self.paths]
+        self.groups = [DailyAggregator(), DailyAggregator()]
+        self.paired_days = 0
+        self.positives = np.zeros(len(self.evaluated), dtype=np.int64)
+        self.trials = np.zeros(len(self.evaluated), dtype=np.int64)
+
+    def refresh(self):
+        """ Fold in the new rows of both files; True if any day was added.
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        pending = [tail.pending for tail in self.tails]
+        try:
+            updates = [tail.read() for tail in self.tails]
+        except ValueError:
+            # A rewritten file cannot be followed by offset, start over
+            self._reset()
+            updates = [tail.read() for tail in self.tails]
+
+        for tail, group, rows in zip(self.tails, self.groups, updates):
+            if tail.header is None:
+                # Nothing but possibly a partial header line yet
+                continue
+            date = tail.header.index("Date")
+            for row in rows:
+                group.append(row[date], _counts(tail.header, row))
+
+        # Sign test counts for the days both groups have now
+        days = min(len(group) for group in self.groups)
+        if days > self.paired_days:
+            positives, trials = self._sign_counts(
+                *[
+                    group.values(days)[self.paired_days :]
+                    for group in self.groups
+                ]
+            )
+            self.positives += positives
+            self.trials += trials
+            self.paired_days = days
+        return any(updates) or pending != [tail.pending for tail in self.tails]
+
+    def _sign_counts(self, control, experiment):
+        differences = metrics.daily_differences(
+            control, experiment, COLUMNS, self.evaluated
+        )
+        return (
+            np.count_nonzero(differences > 0, axis=1),
+            np.count_nonzero(
+                ~np.isnan(differences) & (differences != 0), axis=1
+            ),
+        )
+
+    def _unpaired(self):
+        """ Counts of the days after the paired ones that both groups have,
+        counting the pending rows, which are not folded in yet.
+        """
+        unpaired = []
+        for tail, group in zip(self.tails, self.groups):
+            values = group.values()[self.paired_days :]
+            if tail.pending is not None:
+                values = np.vstack(
+                    [values, [_counts(tail.header, tail.pending)]]
+                )
+            unpaired.append(values)
+        days = min(len(values) for values in unpaired)
+        return [values[:days] for values in unpaired]
+
+    def tables(self):
+        """ The analysis tables of app.py over all paired days. """
+        with self._lock:
+            return self._tables()
+
+    def _tables(self):
+        control, experiment = self._unpaired()
+        control_totals, experiment_totals = [
+            group.totals(self.paired_days) + np.nansum(values, axis=0)
+            for group, values in zip(self.groups, [control, experiment])
+        ]
+        aggregated = analysis.aggregated_table(
+            control_totals, experiment_totals
+        )
+        positives, trials = self._sign_counts(control, experiment)
+        p_values = two_sided_p_values(
+            self.positives + positives, self.trials + trials
+        )
+        return {
+            "number_of_days": self.paired_days + len(control),
+            "aggregated_data": aggregated,
+            "sanity_intervals": analysis.sanity_table(aggregated, self.alpha),
+            "confidence_intervals": metrics.confidence_intervals(
+                control_totals, experiment_totals, self.alpha, self.evaluated,
+            ),
+            "p_values": pd.DataFrame(
+                {
+                    "P-value": p_values,
+                    "Significant": np.where(
+                        p_values < self.alpha, "yes", "no"
+                    ),
+                },
+                index=[metric.name for metric in self.evaluated],
+            ),
+        }